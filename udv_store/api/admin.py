@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserInfo, Activity, UcoinRequest
+from .models import UserInfo, Activity, UcoinRequest, ImportJob
 from .store_models import Product, ProductItem, ProductPhoto, Order
 
 
@@ -44,3 +44,7 @@ class OrdersAdmin(admin.ModelAdmin):
 class ProductPhotoAdmin(admin.ModelAdmin):
     list_display = ('id', 'product_item', 'photo', 'main_photo', 'created_date')
 
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'state', 'progress', 'total', 'created_date')
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.core import checks
+        from . import signals
+        from .utils.versions import check_version_cache
+
+        checks.register(check_version_cache, checks.Tags.caches)
@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.models import UserInfo
+from api.store_models import Product, ProductItem, ProductPhoto, Cart
+from api.utils.benchmark import timed, format_timings
+from api.utils.checkout import checkout
+
+
+class Command(BaseCommand):
+    help = "Measure the time and the queries of a checkout by the size of the cart"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, nargs="+", default=[1, 50], help="Sizes of the carts")
+        parser.add_argument("--runs", type=int, default=50, help="Checkouts of every cart size")
+
+    def handle(self, *args, **options):
+        # everything created here is rolled back at the end, the database is left as it was
+        with transaction.atomic():
+            user = User.objects.create_user("benchmark_checkout_user", password="!")
+            UserInfo.objects.create(user_id=user, first_name="Benchmark", last_name="Checkout", balance=2 ** 31 - 1)
+            product = Product.objects.create(name="Benchmark", price=1, description="",
+                                             state=Product.StateChoice.actual)
+            items = [ProductItem.objects.create(product_id=product, color=f"color {number}")
+                     for number in range(max(options["lines"]))]
+            ProductPhoto.objects.bulk_create([
+                ProductPhoto(product_item=item, photo="images/productItemPhotos/benchmark.png",
+                             created_date=timezone.now())
+                for item in items
+            ])
+
+            for lines in options["lines"]:
+                timings = []
+                for _ in range(options["runs"]):
+                    Cart.objects.bulk_create([Cart(user_id=user, product_item_id=item, size_id=None, count=2)
+                                              for item in items[:lines]])
+                    with CaptureQueriesContext(connection) as queries:
+                        seconds = timed(checkout, user, "LA")[1]
+                    timings.append(seconds)
+                self.stdout.write(f"{lines:>4} lines: {len(queries)} queries, {format_timings(timings)}")
+
+            transaction.set_rollback(True)
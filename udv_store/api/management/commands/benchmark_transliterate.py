@@ -0,0 +1,47 @@
+import random
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from api.utils.benchmark import timed
+from api.utils.transliterator import transliterator, transliterate, transliterate_series
+
+LAST_NAMES = ["Петров", "Иванова", "Щукин", "Жуковская", "Хабибуллин", "Цветаева", "Юдин", "Яковлев", "Эйсмонт",
+              "Чернышёв", "Шевчук", "Кузьмина", "Подъячев", "Ефимов", "Богданович", "Зайцева"]
+FIRST_LETTERS = "абвгдеёжзиклмнопрстуфхцчшэюя"
+# the mapping of the per-character join used before the translation table, it knew spaces and "_" as well
+OLD_TRANSLITERATOR = dict(transliterator, **{" ": " ", "_": "_"})
+
+
+def old_transliterate(word: str) -> str:
+    return "".join([OLD_TRANSLITERATOR[char] for char in word])
+
+
+class Command(BaseCommand):
+    help = "Compare transliterate and transliterate_series with the old per-character join"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--words", type=int, default=300000, help="Username bases to transliterate")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs of each function, the best one is shown")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        # the same bases UsernameAllocator gets: last name, first letters of the first name and patronymic
+        words = [f"{rng.choice(LAST_NAMES).lower()}_{rng.choice(FIRST_LETTERS)}_{rng.choice(FIRST_LETTERS)}"
+                 for _ in range(options["words"])]
+        series = pd.Series(words, dtype=object)
+
+        expected = [old_transliterate(word) for word in words]
+        if [transliterate(word) for word in words] != expected or transliterate_series(series).tolist() != expected:
+            self.stdout.write(self.style.WARNING("The functions give different results"))
+
+        candidates = (
+            ("old per-character join", lambda: [old_transliterate(word) for word in words]),
+            ("transliterate", lambda: [transliterate(word) for word in words]),
+            ("transliterate_series", lambda: transliterate_series(series)),
+        )
+        self.stdout.write(f"{len(words)} words, best of {options['repeat']} runs")
+        for name, function in candidates:
+            seconds = min(timed(function)[1] for _ in range(options["repeat"]))
+            self.stdout.write(f"{name:<23} {seconds:.3f} s")
@@ -0,0 +1,85 @@
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import UserInfo
+from api.utils.benchmark import timed, format_timings
+from api.utils.user_index import UserIndex
+
+FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Мария", "Анна", "Елена", "Дмитрий", "Ольга", "Сергей", "Юлия",
+               "Андрей", "Наталья", "Михаил", "Татьяна", "Николай", "Ксения", "Артём", "Дарья", "Егор", "Алёна"]
+LAST_NAME_ROOTS = ["Иван", "Петр", "Смирн", "Кузнец", "Поп", "Сокол", "Лебед", "Козл", "Новик", "Морозк",
+                   "Волк", "Зайц", "Павл", "Семён", "Голуб", "Виноград", "Богдан", "Ворон", "Фёдор", "Михайл",
+                   "Белоус", "Комар", "Орл", "Киселёв", "Макар", "Андре", "Ковал", "Ильин", "Гусев", "Титов"]
+LAST_NAME_ENDINGS = ["ов", "ев", "ин", "ский", "енко", "ова", "ева", "ина"]
+PATRONYMICS = ["Иванович", "Петрович", "Сергеевна", "Андреевна", "Николаевич", "Михайловна", ""]
+
+
+class Command(BaseCommand):
+    help = "Compare p50/p99 latency of the in-process user search index with the SQL search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100000,
+                            help="Users generated for the run, 0 searches the existing ones")
+        parser.add_argument("--queries", type=int, default=300)
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        # generated users are rolled back at the end, the database is left as it was
+        with transaction.atomic():
+            if options["users"]:
+                self.create_users(rng, options["users"])
+            self.run(rng, options["queries"], options["limit"])
+            transaction.set_rollback(True)
+
+    def create_users(self, rng: random.Random, count: int):
+        for start in range(0, count, 5000):
+            numbers = range(start, min(start + 5000, count))
+            users = User.objects.bulk_create([User(username=f"benchmark_user_{number}", password="!")
+                                              for number in numbers])
+            UserInfo.objects.bulk_create([
+                UserInfo(
+                    user_id=user,
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAME_ROOTS) + rng.choice(LAST_NAME_ENDINGS),
+                    patronymic=rng.choice(PATRONYMICS)
+                ).fill_search_keys()
+                for user in users
+            ])
+        self.stdout.write(f"{count} users generated")
+
+    def run(self, rng: random.Random, queries: int, limit: int):
+        names = list(UserInfo.objects.values_list("last_name", "first_name"))
+        if not names:
+            self.stdout.write(self.style.ERROR("No users to search"))
+            return
+
+        index, build_time = timed(UserIndex.build, 0)
+        self.stdout.write(f"Index of {len(index.records)} users built in {build_time:.2f} s")
+
+        index_timings, orm_timings, mismatches = [], [], 0
+        for _ in range(queries):
+            # a prefix of the last name, sometimes followed by a prefix of the first name
+            last_name, first_name = rng.choice(names)
+            words = [last_name[:rng.randint(1, 5)]]
+            if rng.random() < 0.3:
+                words.append(first_name[:rng.randint(1, 3)])
+            keys = [key for key in map(UserInfo.search_key, words) if key]
+
+            found, seconds = timed(index.search, keys, limit)
+            index_timings.append(seconds)
+            expected, seconds = timed(
+                lambda: list(UserInfo.objects.search(words).values_list("user_id", flat=True)[:limit])
+            )
+            orm_timings.append(seconds)
+            mismatches += [row["user_id"] for row in found] != expected
+
+        self.stdout.write(f"Index: {format_timings(index_timings)}")
+        self.stdout.write(f"ORM:   {format_timings(orm_timings)}")
+        style = self.style.SUCCESS if not mismatches else self.style.WARNING
+        self.stdout.write(style(f"{mismatches} of {queries} queries returned different users"))
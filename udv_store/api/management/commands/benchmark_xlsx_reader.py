@@ -0,0 +1,53 @@
+import os
+import random
+import tempfile
+import tracemalloc
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+
+from api.utils.benchmark import timed
+from api.utils.table_parser import read_xlsx_chunks
+
+COLUMNS = ["Фамилия", "Имя", "Отчество", "Баланс", "Должность"]
+
+
+class Command(BaseCommand):
+    help = "Compare the streaming xlsx reader of the table importer with pd.read_excel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        cols = COLUMNS[:4]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table.xlsx")
+            self.write_workbook(path, options["rows"], random.Random(options["seed"]))
+            self.stdout.write(f"Workbook of {options['rows']} rows, {os.path.getsize(path) / 2 ** 20:.1f} MB")
+
+            def streaming():
+                return sum(len(chunk) for chunk in read_xlsx_chunks(path, cols, options["chunk_size"]))
+
+            def read_excel():
+                return len(pd.read_excel(path, usecols=cols, engine="openpyxl"))
+
+            for name, reader in (("read_xlsx_chunks", streaming), ("pd.read_excel", read_excel)):
+                rows, seconds = timed(reader)
+                # memory is measured by a separate run, tracemalloc slows the reader down
+                tracemalloc.start()
+                reader()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(f"{name:<17} {rows} rows in {seconds:.2f} s, peak memory {peak / 2 ** 20:.1f} MB")
+
+    def write_workbook(self, path: str, rows: int, rng: random.Random):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(COLUMNS)
+        for number in range(rows):
+            sheet.append([f"Фамилия{number}", rng.choice(["Иван", "Мария", "Пётр", "Анна"]),
+                          rng.choice(["Иванович", "Петровна", ""]), rng.randint(0, 1000), "Инженер"])
+        workbook.save(path)
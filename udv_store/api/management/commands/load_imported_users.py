@@ -0,0 +1,38 @@
+import pandas as pd
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import ImportedUser
+
+
+class Command(BaseCommand):
+    help = "Append users from the old master Excel table to the import log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="media/tables/Пользователи из загруженных таблиц.xlsx")
+
+    def handle(self, *args, **options):
+        cols = ["last_name", "first_name", "patronymic", "balance", "generated_username", "date"]
+        df = pd.read_excel(options["path"], usecols=cols, dtype={"date": str}, engine="openpyxl")\
+            .fillna({"patronymic": "", "balance": 0})
+
+        user_ids = dict(
+            User.objects.filter(username__in=df["generated_username"].tolist()).values_list("username", "id")
+        )
+
+        ImportedUser.objects.bulk_create([
+            ImportedUser(
+                user_id_id=user_ids.get(row["generated_username"]),
+                last_name=row["last_name"],
+                first_name=row["first_name"],
+                patronymic=row["patronymic"],
+                balance=int(row["balance"]),
+                username=row["generated_username"],
+                created_date=timezone.make_aware(datetime.fromisoformat(row["date"][:10]))
+            )
+            for row in df.to_dict("records")
+        ], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"{len(df)} users appended to the import log"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import UserInfo
+
+
+class Command(BaseCommand):
+    help = "Recount the unread presents counter of every user from the Present table"
+
+    def handle(self, *args, **options):
+        updated = UserInfo.rebuild_unread_present_counts()
+        self.stdout.write(self.style.SUCCESS(f"Unread present counters rebuilt for {updated} users"))
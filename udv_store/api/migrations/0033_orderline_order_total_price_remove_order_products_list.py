@@ -0,0 +1,87 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:31
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_order_lines(apps, schema_editor):
+    Order = apps.get_model("api", "Order")
+    OrderLine = apps.get_model("api", "OrderLine")
+    ProductItem = apps.get_model("api", "ProductItem")
+    BalanceHistory = apps.get_model("api", "BalanceHistory")
+
+    # old snapshots have no item id and no price, items are restored by product name and color
+    product_items = {}
+    for product_item in ProductItem.objects.select_related("product_id").order_by("id"):
+        product_items.setdefault((product_item.product_id.name, product_item.color), product_item)
+
+    # the debit written when an order was made is its real total, prices may have changed since
+    debits = dict(
+        BalanceHistory.objects.filter(category="OR").order_by("-id").values_list("category_id", "ucoin_count")
+    )
+
+    for order in Order.objects.all().iterator():
+        items = json.loads(bytes(order.products_list) or b"[]")
+        lines = []
+
+        for item in items:
+            product_item = product_items.get((item.get("name"), item.get("color")))
+            price = item.get("price", product_item.product_id.price if product_item else 0)
+
+            lines.append(OrderLine(
+                order_id=order,
+                product_item_id=product_item,
+                name=item.get("name", ""),
+                color=item.get("color", ""),
+                size=item.get("size"),
+                photo=item.get("photo"),
+                price=price,
+                count=item.get("count", 1)
+            ))
+
+        OrderLine.objects.bulk_create(lines)
+        if order.id in debits:
+            order.total_price = debits[order.id]
+        else:
+            order.total_price = sum(line.price * line.count for line in lines)
+        order.save(update_fields=["total_price"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_alter_order_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=25)),
+                ('color', models.CharField(max_length=30)),
+                ('size', models.CharField(blank=True, max_length=10, null=True)),
+                ('photo', models.CharField(blank=True, max_length=200, null=True)),
+                ('price', models.PositiveIntegerField()),
+                ('count', models.PositiveSmallIntegerField()),
+                ('order_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.order')),
+                ('product_item_id', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.productitem')),
+            ],
+            options={
+                'verbose_name': 'Позиция заказа',
+                'verbose_name_plural': 'Позиции заказов',
+            },
+        ),
+        migrations.RunPython(backfill_order_lines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='order',
+            name='products_list',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_orderline_order_total_price_remove_order_products_list'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ucoinrequest',
+            index=models.Index(fields=['state', 'created_date'], name='api_ucoinre_state_40f2fd_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_ucoinrequest_state_created_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='balancehistory',
+            index=models.Index(fields=['user_id', 'created_date'], name='api_balance_user_id_abfe36_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user_id', 'created_date'], name='api_order_user_id_ed2a8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='present',
+            index=models.Index(fields=['user_to', 'created_date'], name='api_present_user_to_294613_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ucoinrequest',
+            index=models.Index(fields=['user_id', 'created_date'], name='api_ucoinre_user_id_e96d06_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread_presents(apps, schema_editor):
+    UserInfo = apps.get_model("api", "UserInfo")
+    Present = apps.get_model("api", "Present")
+
+    unread = Present.objects.filter(user_to=OuterRef("user_id"), state="SN")\
+        .order_by().values("user_to").annotate(count=Count("id")).values("count")
+    UserInfo.objects.update(unread_present_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_history_user_created_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userinfo',
+            name='unread_present_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread_presents, migrations.RunPython.noop),
+    ]
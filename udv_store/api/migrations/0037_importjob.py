@@ -0,0 +1,33 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_userinfo_unread_present_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PT', 'Parse table'), ('RU', 'Register users')], max_length=2)),
+                ('state', models.CharField(choices=[('QD', 'Queued'), ('RN', 'Running'), ('DN', 'Done'), ('FL', 'Failed')], db_index=True, default='QD', max_length=2)),
+                ('params', models.JSONField(default=dict)),
+                ('progress', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, default='')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('last_date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Задачи импорта',
+                'ordering': ['created_date'],
+            },
+        ),
+    ]
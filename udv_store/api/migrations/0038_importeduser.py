@@ -0,0 +1,35 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0037_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_name', models.CharField(max_length=50)),
+                ('first_name', models.CharField(max_length=50)),
+                ('patronymic', models.CharField(blank=True, default='', max_length=50)),
+                ('balance', models.PositiveIntegerField(default=0)),
+                ('username', models.CharField(max_length=150)),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user_id', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Импортированный пользователь',
+                'verbose_name_plural': 'Импортированные пользователи',
+                'ordering': ['created_date'],
+            },
+        ),
+    ]
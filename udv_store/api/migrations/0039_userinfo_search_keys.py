@@ -0,0 +1,95 @@
+# Generated by Django 4.0.3 on 2026-10-18 06:47
+
+import re
+
+from django.db import migrations, models
+
+# a copy of api.utils.transliterator as of this migration, so later changes of the mapping don't change it
+TRANSLITERATION = str.maketrans({
+    "А": "A", "Б": "B", "В": "V", "Г": "G",
+    "Д": "D", "Е": "E", "Ё": "E", "Ж": "Zh",
+    "З": "Z", "И": "I", "Й": "I", "К": "K",
+    "Л": "L", "М": "M", "Н": "N", "О": "O",
+    "П": "P", "Р": "R", "С": "S", "Т": "T",
+    "У": "U", "Ф": "F", "Х": "Kh", "Ц": "Ts",
+    "Ч": "Ch", "Ш": "Sh", "Щ": "Shch", "Ъ": "Ie",
+    "Ы": "Y", "Ь": "", "Э": "E", "Ю": "Iu",
+    "Я": "Ia",
+
+    "а": "a", "б": "b", "в": "v", "г": "g",
+    "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k",
+    "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t",
+    "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "ie",
+    "ы": "y", "ь": "", "э": "e", "ю": "iu",
+    "я": "ia",
+
+    "Є": "Ie", "І": "I", "Ї": "I", "Ґ": "G", "Ў": "U",
+    "є": "ie", "і": "i", "ї": "i", "ґ": "g", "ў": "u",
+
+    "Ә": "A", "Ғ": "G", "Қ": "K", "Ң": "N", "Ө": "O", "Ұ": "U", "Ү": "U", "Һ": "H",
+    "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u", "һ": "h",
+
+    "’": "", "ʼ": "",
+})
+UNKNOWN_CHARS = re.compile(r"[^\x00-\x7f]")
+BATCH_SIZE = 2000
+
+
+def search_key(value: str) -> str:
+    return UNKNOWN_CHARS.sub("", value.translate(TRANSLITERATION)).lower()
+
+
+def fill_search_keys(apps, schema_editor):
+    UserInfo = apps.get_model("api", "UserInfo")
+    fields = ["first_name_key", "last_name_key", "patronymic_key"]
+
+    infos = []
+    for info in UserInfo.objects.only("first_name", "last_name", "patronymic").iterator(chunk_size=BATCH_SIZE):
+        for field in ("first_name", "last_name", "patronymic"):
+            setattr(info, f"{field}_key", search_key(getattr(info, field) or ""))
+        infos.append(info)
+        if len(infos) == BATCH_SIZE:
+            UserInfo.objects.bulk_update(infos, fields)
+            infos = []
+    UserInfo.objects.bulk_update(infos, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_importeduser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userinfo',
+            name='first_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='userinfo',
+            name='last_name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='userinfo',
+            name='patronymic_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userinfo',
+            index=models.Index(fields=['last_name_key'], name='api_userinfo_last_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='userinfo',
+            index=models.Index(fields=['first_name_key'], name='api_userinfo_first_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='userinfo',
+            index=models.Index(fields=['patronymic_key'], name='api_userinfo_patr_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+def fill_size_availability(apps, schema_editor):
+    Product = apps.get_model("api", "Product")
+    ProductItem = apps.get_model("api", "ProductItem")
+
+    Size = apps.get_model("api", "Size")
+
+    # sizes take dense positions in the mask by the order of their ids, as they are kept by 0043_size_bit
+    bits = {size_id: bit for bit, size_id in enumerate(Size.objects.order_by("id").values_list("id", flat=True))}
+    masks = dict.fromkeys(ProductItem.objects.values_list("id", flat=True), 0)
+    for item_id, size_id in ProductItem.sizes.through.objects.values_list("productitem_id", "size_id"):
+        if bits[size_id] < 63:
+            masks[item_id] |= 1 << bits[size_id]
+
+    items = list(ProductItem.objects.only("id", "product_id"))
+    totals = {}
+    for item in items:
+        item.size_mask = masks[item.id]
+        product_totals = totals.setdefault(item.product_id_id, [0, 0])
+        product_totals[0] += 1
+        product_totals[1] += bin(item.size_mask).count("1")
+    ProductItem.objects.bulk_update(items, ["size_mask"], batch_size=1000)
+
+    products = list(Product.objects.filter(product_id__in=totals.keys()).only("product_id"))
+    for product in products:
+        product.items_total, product.sizes_total = totals[product.product_id]
+    Product.objects.bulk_update(products, ["items_total", "sizes_total"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_cart_unique_line'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='items_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sizes_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productitem',
+            name='size_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_size_availability, migrations.RunPython.noop),
+    ]
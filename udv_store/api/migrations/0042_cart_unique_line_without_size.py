@@ -0,0 +1,30 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum, Min
+
+
+def merge_duplicate_lines_without_size(apps, schema_editor):
+    Cart = apps.get_model("api", "Cart")
+
+    duplicates = Cart.objects.filter(size_id__isnull=True).values("user_id", "product_item_id")\
+        .annotate(lines=Count("id"), total=Sum("count"), first_id=Min("id")).filter(lines__gt=1)
+    for line in duplicates:
+        Cart.objects.filter(id=line["first_id"]).update(count=min(line["total"], 32767))
+        Cart.objects.filter(user_id=line["user_id"], product_item_id=line["product_item_id"], size_id__isnull=True)\
+            .exclude(id=line["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_size_availability'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines_without_size, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('size_id__isnull', True)), fields=('user_id', 'product_item_id'), name='api_cart_unique_line_without_size'),
+        ),
+    ]
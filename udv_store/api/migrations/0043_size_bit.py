@@ -0,0 +1,41 @@
+# Generated by Django 4.0.3 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+def fill_size_bits(apps, schema_editor):
+    Size = apps.get_model("api", "Size")
+    ProductItem = apps.get_model("api", "ProductItem")
+
+    # masks were built from the raw size ids before, they are rebuilt from the dense positions
+    sizes = list(Size.objects.order_by("id")[:63])
+    for bit, size in enumerate(sizes):
+        size.bit = bit
+    Size.objects.bulk_update(sizes, ["bit"], batch_size=1000)
+    bits = {size.id: size.bit for size in sizes}
+
+    masks = dict.fromkeys(ProductItem.objects.values_list("id", flat=True), 0)
+    for item_id, size_id in ProductItem.sizes.through.objects.values_list("productitem_id", "size_id"):
+        if size_id in bits:
+            masks[item_id] |= 1 << bits[size_id]
+
+    items = list(ProductItem.objects.only("id"))
+    for item in items:
+        item.size_mask = masks[item.id]
+    ProductItem.objects.bulk_update(items, ["size_mask"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_cart_unique_line_without_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='size',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_size_bits, migrations.RunPython.noop),
+    ]
@@ -1,39 +1,66 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Count, OuterRef, Subquery, Case, When, Value, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
-from itertools import groupby
+from .utils.transliterator import transliterate
 
 
 class Customer(User):
     def clear_cart(self):
-        [c.delete() for c in self.cart_set.all()]
+        self.cart_set.all().delete()
 
-    def cart_items(self):
-        return {
-            c.id: c.item_info() for c in self.cart_set.all()
-        }
+    def cart_lines(self):
+        return self.cart_set.with_products()
 
-    def product_cart_info(self):
+    def cart_items(self, lines=None):
         return {
-            product.product_id: {
-                'name': product.name,
-                'price': product.price,
-                'color': {
-                    item.color: item.photo_main() for item in items
-                }
-            }
-            for product, items in {
-                group_: set([i['product_item'] for i in iter_])
-                for group_, iter_ in groupby(
-                    [c.item_params() for c in self.cart_set.all()],
-                    lambda x: x['product']
-                )
-            }.items()
+            c.id: c.item_info() for c in (self.cart_lines() if lines is None else lines)
         }
 
+    def product_cart_info(self, lines=None):
+        # lines of the same product are collected in one entry whatever order they come in
+        products = {}
+        for c in (self.cart_lines() if lines is None else lines):
+            item = c.product_item_id
+            product = products.setdefault(item.product_id_id, {
+                'name': item.product_id.name,
+                'price': item.product_id.price,
+                'color': {}
+            })
+            product['color'][item.color] = item.photo_main()
+        return products
+
     class Meta:
         proxy = True
 
 
+class UserInfoQuerySet(models.QuerySet):
+    def search(self, words: list):
+        # every word is a prefix of one of the names, exact and last name matches are ranked higher
+        keys = [key for key in map(UserInfo.search_key, words) if key]
+        if not keys:
+            return self.none()
+
+        matches = Q()
+        ranks = []
+        for key in keys:
+            matches &= Q(last_name_key__startswith=key) | Q(first_name_key__startswith=key) | \
+                Q(patronymic_key__startswith=key)
+            ranks.append(Case(
+                When(last_name_key=key, then=Value(6)),
+                When(first_name_key=key, then=Value(5)),
+                When(last_name_key__startswith=key, then=Value(4)),
+                When(first_name_key__startswith=key, then=Value(3)),
+                When(patronymic_key=key, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField()
+            ))
+
+        return self.filter(matches).annotate(search_rank=sum(ranks[1:], ranks[0]))\
+            .order_by("-search_rank", "last_name_key", "first_name_key", "user_id")
+
+
 class UserInfo(models.Model):
     user_id = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
 
@@ -48,11 +75,41 @@ class UserInfo(models.Model):
     last_name = models.CharField(max_length=50, null=False, blank=False)
     patronymic = models.CharField(max_length=50, null=False, blank=True, default="")
     position = models.CharField(max_length=70, null=True, blank=True)
+    unread_present_count = models.PositiveIntegerField(default=0)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    objects = UserInfoQuerySet.as_manager()
+
+    # lowercase latin forms of the names for the people search, filled on save
+    first_name_key = models.CharField(max_length=200, default="", blank=True, editable=False)
+    last_name_key = models.CharField(max_length=200, default="", blank=True, editable=False)
+    patronymic_key = models.CharField(max_length=200, default="", blank=True, editable=False)
+
+    SEARCH_FIELDS = ("first_name", "last_name", "patronymic")
+
+    @staticmethod
+    def search_key(name: str) -> str:
+        return transliterate(str(name or "")).lower()
+
+    def fill_search_keys(self):
+        for field in self.SEARCH_FIELDS:
+            setattr(self, f"{field}_key", self.search_key(getattr(self, field)))
+        return self
+
+    def save(self, *args, **kwargs):
+        self.fill_search_keys()
+        super().save(*args, **kwargs)
+
     def get_full_name(self):
         return ' '.join([str(self.first_name), str(self.last_name)])
 
+    @classmethod
+    def rebuild_unread_present_counts(cls):
+        # one UPDATE recounting unread presents of every user
+        unread = Present.objects.filter(user_to=OuterRef("user_id"), state="SN")\
+            .order_by().values("user_to").annotate(count=Count("id")).values("count")
+        return cls.objects.update(unread_present_count=Coalesce(Subquery(unread), 0))
+
     def set_role_moderator(self):
         self.role = "MR"
         self.save()
@@ -65,16 +122,15 @@ class UserInfo(models.Model):
         self.role = "AR"
         self.save()
 
-    def change_balance(self, count: int, action: str):
-        if action == "add":
-            self.balance += count
-        if action == "remove":
-            self.balance -= count
-        self.save()
-
     class Meta:
         verbose_name = "Информация о пользователе"
         verbose_name_plural = "Информация о пользователях"
+        # varchar_pattern_ops lets postgres use the indexes for LIKE 'prefix%' whatever the collation is
+        indexes = [
+            models.Index(fields=["last_name_key"], name="api_userinfo_last_key_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["first_name_key"], name="api_userinfo_first_key_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["patronymic_key"], name="api_userinfo_patr_key_idx", opclasses=["varchar_pattern_ops"]),
+        ]
 
 
 class Activity(models.Model):
@@ -113,6 +169,10 @@ class UcoinRequest(models.Model):
     class Meta:
         ordering = ["-created_date"]
         get_latest_by = ["created_date"]
+        indexes = [
+            models.Index(fields=["state", "created_date"]),
+            models.Index(fields=["user_id", "created_date"]),
+        ]
         verbose_name = "Запрос"
         verbose_name_plural = "Запросы"
 
@@ -155,13 +215,21 @@ class Present(models.Model):
     state = models.CharField(max_length=2, choices=StateChoice.choices, default=StateChoice.sent, db_index=True)
 
     def set_state_read(self):
+        # only the request that really switched the state decrements the unread counter
+        with transaction.atomic():
+            if Present.objects.filter(id=self.id, state="SN").update(state="RD"):
+                # the counter may have drifted to 0 for presents created around create_present (shell, admin)
+                UserInfo.objects.filter(user_id=self.user_to_id, unread_present_count__gt=0)\
+                    .update(unread_present_count=F("unread_present_count") - 1)
         self.state = "RD"
-        self.save()
 
     class Meta:
         verbose_name = "Подарок"
         verbose_name_plural = "Подарки"
         ordering = ["-created_date"]
+        indexes = [
+            models.Index(fields=["user_to", "created_date"]),
+        ]
 
     def sender_full_name(self):
         return User.objects.get(id=self.user_from).userinfo.get_full_name()
@@ -191,8 +259,65 @@ class BalanceHistory(models.Model):
         verbose_name = "История баланса"
         verbose_name_plural = "История баланса"
         ordering = ["-created_date"]
+        indexes = [
+            models.Index(fields=["user_id", "created_date"]),
+        ]
 
 
+class ImportedUser(models.Model):
+    # append-only record of users registered from uploaded tables
+    user_id = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    last_name = models.CharField(max_length=50)
+    first_name = models.CharField(max_length=50)
+    patronymic = models.CharField(max_length=50, blank=True, default="")
+    balance = models.PositiveIntegerField(default=0)
+    username = models.CharField(max_length=150)
+    created_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Импортированный пользователь"
+        verbose_name_plural = "Импортированные пользователи"
+        ordering = ["created_date"]
+
+
+class ImportJob(models.Model):
+    class KindChoice(models.TextChoices):
+        parse_table = "PT", "Parse table"
+        register_users = "RU", "Register users"
+
+    kind = models.CharField(max_length=2, choices=KindChoice.choices)
+
+    class StateChoice(models.TextChoices):
+        queued = "QD", "Queued"
+        running = "RN", "Running"
+        done = "DN", "Done"
+        failed = "FL", "Failed"
+
+    state = models.CharField(max_length=2, choices=StateChoice.choices, default=StateChoice.queued, db_index=True)
+    params = models.JSONField(default=dict)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error_message = models.TextField(default="", blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Задача импорта"
+        verbose_name_plural = "Задачи импорта"
+        ordering = ["created_date"]
+
+    def get_status(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "progress": self.progress,
+            "total": self.total,
+            "result": self.result,
+            "error_message": self.error_message
+        }
+
 
 # class UserHistory(models.Model):
 #     class CategoryChoice(models.TextChoices):
@@ -0,0 +1,15 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# Keyset pagination over created_date, the cursor is an opaque base64 token.
+# Page size may be changed by a client with ?page_size= up to max_page_size.
+class NewestFirstPagination(CursorPagination):
+    ordering = "-created_date"
+    page_size = getattr(settings, "HISTORY_PAGE_SIZE", 50)
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class OldestFirstPagination(NewestFirstPagination):
+    ordering = "created_date"
@@ -91,6 +91,11 @@ class PresentSerializer(serializers.ModelSerializer):
         model = Present
         fields = "__all__"
 
+    def validate_ucoin_count(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Количество юкоинов должно быть больше нуля")
+        return value
+
 # class ProductStoreItemSerializer(serializers.ModelSerializer):
 #     product_id = serializers.IntegerField()
 #     product_category = serializers.IntegerField()
@@ -116,7 +121,7 @@ class OrderSerializer(serializers.ModelSerializer):
 class OrderListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ("id", "state", "created_date", "products_list")
+        fields = ("id", "state", "created_date", "total_price")
 
 
 # Custom Serializers
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import UserInfo
+from .store_models import Product, ProductItem, ProductPhoto, Size
+from .utils.catalog_cache import bump_catalog_version
+from .utils.sizes import bump_sizes_version
+from .utils.user_index import make_record, user_saved, user_deleted
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductItem)
+@receiver(post_save, sender=ProductPhoto)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductItem)
+@receiver(post_delete, sender=ProductPhoto)
+def catalog_changed(sender, **kwargs):
+    # the version is bumped after commit, otherwise a concurrent reader could cache the old state under it
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=ProductItem.sizes.through)
+def item_sizes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        # the instance gets the new mask too, so saving it later doesn't write the old one back
+        if not reverse and action != "post_clear":
+            instance.size_mask = ProductItem.change_size_bits(instance.pk, pk_set, added=action == "post_add")
+        elif not reverse:
+            instance.size_mask = ProductItem.refresh_size_masks([instance.pk])[instance.pk]
+        elif pk_set is not None:
+            ProductItem.refresh_size_masks(pk_set)
+        else:
+            ProductItem.refresh_size_masks(ProductItem.objects.exclude(size_mask=0).values_list("id", flat=True))
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+def item_changed(sender, instance, **kwargs):
+    Product.refresh_availability([instance.product_id_id])
+
+
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def sizes_changed(sender, **kwargs):
+    # names of the sizes are rendered into the cached catalog pages
+    transaction.on_commit(bump_sizes_version)
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_delete, sender=Size)
+def size_deleted(sender, **kwargs):
+    # rows of the deleted size are removed from the m2m table without m2m_changed
+    ProductItem.refresh_size_masks(ProductItem.objects.exclude(size_mask=0).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=UserInfo)
+def user_info_saved(sender, instance, **kwargs):
+    record = make_record(str(instance.role), instance.first_name, instance.last_name, instance.patronymic,
+                         instance.first_name_key, instance.last_name_key, instance.patronymic_key)
+    user_id = instance.user_id_id
+    transaction.on_commit(lambda: user_saved(user_id, record))
+
+
+@receiver(post_delete, sender=UserInfo)
+def user_info_deleted(sender, instance, **kwargs):
+    user_id = instance.user_id_id
+    transaction.on_commit(lambda: user_deleted(user_id))
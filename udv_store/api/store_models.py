@@ -1,9 +1,24 @@
-import io
-
-from django.db import models
+from django.db import models, connection, transaction
 from django.contrib.auth.models import User
-from django.db.models import Q
-from rest_framework.parsers import JSONParser
+from django.db.models import F, Q, Prefetch
+
+from .utils.sizes import NO_SIZE, size_bit, sizes_from_mask, ordered_sizes, require_size_id, get_size_name, \
+    free_size_bit
+
+
+class ProductQuerySet(models.QuerySet):
+    def in_store(self):
+        # availability is kept up to date on the products, see Product.refresh_availability
+        return self.filter(Q(items_total__gt=0) & (Q(sizes_total__gt=0) | Q(have_size=False)) & Q(state="Actual"))
+
+    def with_items(self):
+        # items and their photos are loaded with one query per relation, sizes are read from size_mask
+        return self.prefetch_related(
+            Prefetch(
+                "productitem_set",
+                queryset=ProductItem.objects.prefetch_related("productphoto_set")
+            )
+        )
 
 
 class Product(models.Model):
@@ -21,6 +36,12 @@ class Product(models.Model):
 
     state = models.CharField(max_length=50, choices=StateChoice.choices, default=StateChoice.archived, db_index=True)
 
+    # number of items and of (item, size) pairs, maintained by Product.refresh_availability
+    items_total = models.PositiveIntegerField(default=0, editable=False)
+    sizes_total = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
@@ -49,7 +70,24 @@ class Product(models.Model):
     #     return '/'.join(self.default_photo.path.split("/")[-2:])
 
     def item_count(self):
-        return sum([pi.sizes.count() for pi in self.productitem_set.all()])
+        return self.sizes_total
+
+    @classmethod
+    def refresh_availability(cls, product_ids):
+        # products are locked first, so concurrent refreshes of one product read the masks one after another.
+        # post_save of an item is sent after its own transaction, so the lock needs one of its own
+        with transaction.atomic():
+            products = list(cls.objects.select_for_update().filter(product_id__in=product_ids)
+                            .only("product_id").order_by("product_id"))
+            totals = {product.product_id: [0, 0] for product in products}
+            for product_id, size_mask in ProductItem.objects.filter(product_id__in=totals.keys())\
+                    .values_list("product_id", "size_mask"):
+                totals[product_id][0] += 1
+                totals[product_id][1] += bin(size_mask).count("1")
+
+            for product in products:
+                product.items_total, product.sizes_total = totals[product.product_id]
+            cls.objects.bulk_update(products, ["items_total", "sizes_total"])
 
     def items_list_1(self):
         # return [
@@ -88,16 +126,25 @@ class Product(models.Model):
 
 class Size(models.Model):
     size = models.CharField(max_length=10, default="M", db_index=True, null=False, blank=False)
+    # position of the size in ProductItem.size_mask, positions of deleted sizes are taken again
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, editable=False)
 
     def __str__(self):
         return self.size
 
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            self.bit = free_size_bit(Size.objects.exclude(bit=None).values_list("bit", flat=True))
+        super().save(*args, **kwargs)
+
 
 class ProductItem(models.Model):
     product_id = models.ForeignKey(Product, on_delete=models.CASCADE)
     color = models.CharField(max_length=30, default="чёрн", null=False, blank=False, db_index=True)
     # photo = models.ImageField(upload_to="images/productItemPhotos/")
     sizes = models.ManyToManyField(Size, blank=True)
+    # a bit per size of the sizes above at its Size.bit, maintained by the m2m_changed signal
+    size_mask = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ["product_id", "color"]
@@ -107,24 +154,53 @@ class ProductItem(models.Model):
     def __str__(self):
         return f"{self.product_id.name} {self.color}"
 
+    # size_mask and the catalog version are updated by the m2m_changed signal
     def add_size(self, new_size):
-        self.sizes.add(Size.objects.get(size=new_size))
-        self.save()
+        self.sizes.add(require_size_id(new_size))
 
     def remove_size(self, removed_size):
-        self.sizes.remove(Size.objects.get(size=removed_size))
-        self.save()
+        self.sizes.remove(require_size_id(removed_size))
+
+    @classmethod
+    def change_size_bits(cls, item_id: int, size_ids, added: bool) -> int:
+        # only the bits of the sizes are changed by one UPDATE, so concurrent changes of the item are all kept
+        bits = 0
+        for size_id in size_ids:
+            bits |= size_bit(size_id)
+        cls.objects.filter(id=item_id).update(
+            size_mask=F("size_mask").bitor(bits) if added else F("size_mask").bitand(~bits)
+        )
+        item = cls.objects.only("size_mask", "product_id").get(id=item_id)
+        Product.refresh_availability([item.product_id_id])
+        return item.size_mask
+
+    @classmethod
+    def refresh_size_masks(cls, item_ids):
+        # masks are rebuilt from the m2m table, then the totals of their products
+        masks = dict.fromkeys(item_ids, 0)
+        for item_id, size_id in cls.sizes.through.objects.filter(productitem_id__in=masks.keys())\
+                .values_list("productitem_id", "size_id"):
+            masks[item_id] |= size_bit(size_id)
+
+        items = list(cls.objects.filter(id__in=masks.keys()).only("id", "product_id"))
+        for item in items:
+            item.size_mask = masks[item.id]
+        cls.objects.bulk_update(items, ["size_mask"])
+        Product.refresh_availability({item.product_id_id for item in items})
+        return masks
+
+    def size_list(self):
+        return sizes_from_mask(self.size_mask)
 
     # def photo_path(self):
     #     return "/".join(self.photo.path.split("/")[-2:])
 
     def get_item_info_to_admin(self):
-        sizes_unused = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
-        sizes = [s.size for s in self.sizes.all()]
+        sizes = self.size_list()
+        sizes_unused = [size for size in ordered_sizes() if size != NO_SIZE]
 
-        if "No size" not in sizes:
-            for size in sizes:
-                sizes_unused.remove(size)
+        if NO_SIZE not in sizes:
+            sizes_unused = [size for size in sizes_unused if size not in sizes]
 
         return {
             "item_id": self.id,
@@ -138,30 +214,88 @@ class ProductItem(models.Model):
         return {
             "id": self.id,
             "color": self.color,
-            "sizes": [s.size for s in self.sizes.all()],
+            "sizes": self.size_list(),
             "photo": self.photo_list(),
         }
 
     def photo_main(self):
-        return self.productphoto_set.first().photo_path()
+        # indexing .all() keeps using prefetched photos instead of a new query
+        photos = self.productphoto_set.all()
+        return photos[0].photo_path() if photos else None
 
     def photo_list(self):
         return [photo.photo_path() for photo in self.productphoto_set.all()]
 
 
+class CartQuerySet(models.QuerySet):
+    def with_products(self):
+        # items and products are joined to the cart rows, photos come with one more query, sizes from the registry
+        return self.select_related("product_item_id__product_id")\
+            .prefetch_related("product_item_id__productphoto_set").order_by("id")
+
+    def change_count(self, action: str):
+        # one UPDATE, the count is never taken below zero
+        if action == "add":
+            return self.update(count=F("count") + 1)
+        return self.filter(count__gt=0).update(count=F("count") - 1)
+
+
 class Cart(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
     product_item_id = models.ForeignKey(ProductItem, on_delete=models.CASCADE)
     size_id = models.ForeignKey(Size, on_delete=models.CASCADE, default=4, null=True)
     count = models.PositiveSmallIntegerField()
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "product_item_id", "size_id"], name="api_cart_unique_line"),
+            # NULLs never conflict in the constraint above, lines without a size need their own one
+            models.UniqueConstraint(fields=["user_id", "product_item_id"], condition=Q(size_id__isnull=True),
+                                    name="api_cart_unique_line_without_size"),
+        ]
+
+    @classmethod
+    def add_item(cls, user_id: int, product_item_id: int, size_id):
+        """
+        Puts one more item to the cart and returns the id of the cart line, or None if the item doesn't exist.
+        A new line is inserted or the count of the existing one is incremented by the same statement.
+        """
+        if connection.vendor in ("postgresql", "sqlite"):
+            table = cls._meta.db_table
+            # the conflict target names the unique constraint the new line falls under
+            if size_id is None:
+                target = "(user_id_id, product_item_id_id) WHERE size_id_id IS NULL"
+            else:
+                target = "(user_id_id, product_item_id_id, size_id_id)"
+            # the row is selected from the items, so nothing is inserted for an unknown item
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id_id, product_item_id_id, size_id_id, count) "
+                    f"SELECT %s, id, %s, 1 FROM {ProductItem._meta.db_table} WHERE id = %s "
+                    f"ON CONFLICT {target} DO UPDATE SET count = {table}.count + 1 RETURNING id",
+                    [user_id, size_id, product_item_id]
+                )
+                row = cursor.fetchone()
+            return row[0] if row is not None else None
+
+        # other databases have no upsert with RETURNING
+        with transaction.atomic():
+            if not ProductItem.objects.filter(id=product_item_id).exists():
+                return None
+            line, created = cls.objects.select_for_update().get_or_create(
+                user_id_id=user_id, product_item_id_id=product_item_id, size_id_id=size_id, defaults={"count": 1}
+            )
+            if not created:
+                cls.objects.filter(id=line.id).change_count("add")
+        return line.id
 
     def item_info(self):
         return {
-            "product_id": self.product_item_id.product_id.product_id,
+            "product_id": self.product_item_id.product_id_id,
             "product_item_id": self.product_item_id.id,
             "color": self.product_item_id.color,
             "size": self.get_size(),
@@ -169,26 +303,18 @@ class Cart(models.Model):
         }
 
     def get_size(self):
-        return self.size_id.size if self.size_id else None
-
-    def item_params(self):
-        return {
-            "product_item": self.product_item_id,
-            "product": self.product_item_id.product_id
-        }
-
-    def get_order_info(self):
-        return {
-            "name": self.product_item_id.product_id.name,
-            "color": self.product_item_id.color,
-            "size": self.get_size(),
-            "photo": self.product_item_id.photo_main(),
-            "count": self.count
-        }
+        return get_size_name(self.size_id_id)
 
-    def change_count(self, action: str):
-        self.count += 1 if action == "add" else -1
-        self.save()
+    def get_order_line(self):
+        return OrderLine(
+            product_item_id=self.product_item_id,
+            name=self.product_item_id.product_id.name,
+            color=self.product_item_id.color,
+            size=self.get_size(),
+            photo=self.product_item_id.photo_main(),
+            price=self.product_item_id.product_id.price,
+            count=self.count
+        )
 
 
 class ProductPhoto(models.Model):
@@ -211,7 +337,7 @@ class ProductPhoto(models.Model):
 
 class Order(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
-    products_list = models.BinaryField(null=False, blank=False)
+    total_price = models.PositiveIntegerField(default=0)
     created_date = models.DateTimeField(auto_now_add=True)
 
     class OfficesChoice(models.TextChoices):
@@ -231,6 +357,9 @@ class Order(models.Model):
     class Meta:
         ordering = ["created_date"]
         get_latest_by = ["created_date"]
+        indexes = [
+            models.Index(fields=["user_id", "created_date"]),
+        ]
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
 
@@ -242,15 +371,15 @@ class Order(models.Model):
         self.state = "In progress"
         self.save()
 
-    def get_parsed_product_list(self):
-        return JSONParser().parse(io.BytesIO(self.products_list))
+    def get_product_list(self):
+        return [line.get_info() for line in self.orderline_set.all()]
 
     def get_detail_info(self):
         return {
             "id": self.id,
             "user_id": self.user_id.id,
             "user_name": self.user_id.userinfo.get_full_name(),
-            "product_list": self.get_parsed_product_list(),
+            "product_list": self.get_product_list(),
             "office": self.office_address,
             "date": self.created_date,
             "state": self.state
@@ -265,13 +394,11 @@ class Order(models.Model):
         }
 
     def get_full_price(self):
-        return sum([
-            item["price"] * item["count"] for item in self.get_parsed_product_list()
-        ])
+        return self.total_price
 
     def get_first_three_photo_in_product_list(self):
         # return [
-        #     item["photo"] for item in self.get_parsed_product_list()[:3]
+        #     item["photo"] for item in self.get_product_list()[:3]
         # ]
         pass
 
@@ -284,3 +411,28 @@ class Order(models.Model):
             "state": self.state
         }
 
+
+class OrderLine(models.Model):
+    order_id = models.ForeignKey(Order, on_delete=models.CASCADE)
+    product_item_id = models.ForeignKey(ProductItem, on_delete=models.SET_NULL, null=True)
+    # snapshot of the product item at the moment of the order
+    name = models.CharField(max_length=25)
+    color = models.CharField(max_length=30)
+    size = models.CharField(max_length=10, null=True, blank=True)
+    photo = models.CharField(max_length=200, null=True, blank=True)
+    price = models.PositiveIntegerField()
+    count = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Позиция заказа"
+        verbose_name_plural = "Позиции заказов"
+
+    def get_info(self):
+        return {
+            "name": self.name,
+            "color": self.color,
+            "size": self.size,
+            "photo": self.photo,
+            "price": self.price,
+            "count": self.count
+        }
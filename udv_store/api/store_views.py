@@ -1,22 +1,30 @@
 import io, os
 
-from django.db.models import Q, Count
+from django.http import HttpResponse
+from django.views.decorators.http import condition
 from rest_framework.decorators import api_view, permission_classes, renderer_classes, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 
-from .models import BalanceHistory, Customer
-from .store_models import Product, ProductItem, Size, Cart, Order
+from .pagination import OldestFirstPagination
+from .models import Customer
+from .store_models import Product, ProductItem, Cart, Order
+from .utils.catalog_cache import get_catalog_page
+from .utils.conditional import catalog_etag, orders_etag
+from .utils.checkout import checkout, EmptyCart
+from .utils.ledger import NotEnoughUcoins
+from .utils.sizes import NO_SIZE, get_size_id, require_size_id
 from .serializer import OrderListSerializer, ProductsSerializer, CustomOrdersSerializer, \
     OrderSerializer, ProductItemSerializer, ProductInStoreSerializer, ProductInAdminSerializer, \
     ProductItemInAdminSerializer, CustomerCartProductInfoSerializer, \
-    ProductInProductPageSerializer, CustomerCartItemSerializer, CartSerializer
+    ProductInProductPageSerializer, CustomerCartItemSerializer
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=orders_etag)
 def get_user_orders_latest(request):
     return Response([
         order.get_info_to_list_to_personal_page() for order in request.user.order_set.all()[:2]
@@ -25,24 +33,28 @@ def get_user_orders_latest(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=orders_etag)
 def get_user_orders_full(request):
-    return Response([
-        order.get_info_to_list_to_personal_page() for order in request.user.order_set.all()
+    paginator = OldestFirstPagination()
+    page = paginator.paginate_queryset(request.user.order_set.all(), request)
+    return paginator.get_paginated_response([
+        order.get_info_to_list_to_personal_page() for order in page
     ])
 
 
 @api_view(["GET"])
+@condition(etag_func=catalog_etag)
 def get_products_to_store(request):
-    products = Product.objects.annotate(
-        items_count=Count("productitem"), item_sizes_count=Count("productitem__sizes"))\
-        .filter(Q(items_count__gt=0) & (Q(item_sizes_count__gt=0) | Q(have_size=False)) & Q(state="Actual"))
+    def render():
+        products = Product.objects.in_store().with_items()
+        return JSONRenderer().render(ProductInStoreSerializer(products, many=True).data)
 
-    return Response(ProductInStoreSerializer(products, many=True).data)
+    return HttpResponse(get_catalog_page("store", render), content_type="application/json")
 
 
 @api_view(["GET"])
 def get_products_to_admin(request):
-    return Response(ProductInAdminSerializer(Product.objects.all(), many=True).data)
+    return Response(ProductInAdminSerializer(Product.objects.with_items(), many=True).data)
 
 
 @api_view(["POST"])
@@ -76,24 +88,28 @@ def manage_product(request, pk):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=catalog_etag)
 def get_items_to_product_page(request, pk):
-    product_response = ProductInProductPageSerializer(
-            Product.objects.get(product_id=pk),
+    def render():
+        product_response = ProductInProductPageSerializer(
+            Product.objects.with_items().get(product_id=pk),
             many=False
         ).data
-    return Response(
-        {
-            "product": product_response,
-            "in_cart": "some"
-        }
-    )
+        return JSONRenderer().render(
+            {
+                "product": product_response,
+                "in_cart": "some"
+            }
+        )
+
+    return HttpResponse(get_catalog_page(f"product:{pk}", render), content_type="application/json")
 
 
 @api_view(["GET"])
 def get_items_list_to_admin(request, pk):
     return Response(
         ProductItemInAdminSerializer(
-            Product.objects.get(product_id=pk),
+            Product.objects.with_items().get(product_id=pk),
             many=False
         ).data
     )
@@ -111,7 +127,7 @@ def create_item(request):
     )
 
     if data["set_size"] == "false":
-        pi.sizes.add(Size.objects.get(size="No size"))
+        pi.sizes.add(require_size_id(NO_SIZE))
 
     return Response(ProductItemSerializer(pi).data)
 
@@ -157,40 +173,51 @@ def get_cart(request, param):
                                 '\"product-info\" or \"product-item\"'}, status=500)
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_full_cart(request):
+    # both views of the cart are built from the same lines
+    customer = Customer.objects.get(id=request.user.id)
+    lines = list(customer.cart_lines())
+
+    return Response({
+        "product_cart_info": customer.product_cart_info(lines),
+        "cart_items": customer.cart_items(lines)
+    })
+
+
 @api_view(["POST", "DELETE"])
 @permission_classes([IsAuthenticated])
 def manage_cart_by_pk(request, pk):
     data = request.data
 
     if request.method == "POST":
-        cart_item = request.user.cart_set.get(id=pk)
         if data.get("action"):
-            cart_item.change_count(data["action"])
+            request.user.cart_set.filter(id=pk).change_count(data["action"])
 
     if request.method == "DELETE":
-        request.user.cart_set.get(id=pk).delete()
+        request.user.cart_set.filter(id=pk).delete()
 
     return Response({"message": "Successfully!"})
 
 
 @api_view(["POST", "DELETE"])
+@permission_classes([IsAuthenticated])
 def manage_cart(request):
     data = request.data
+    size_id = get_size_id(data["size"])
 
     if request.method == "POST":
-        cart_item, created = request.user.cart_set.get_or_create(
-            product_item_id=ProductItem.objects.get(id=data["product_item_id"]),
-            size_id=Size.objects.filter(size=data["size"]).first(),
-            defaults={"count": 1}
-        )
+        cart_id = Cart.add_item(request.user.id, int(data["product_item_id"]), size_id)
+        if cart_id is None:
+            return Response({"error_message": "Товар не найден"}, status=400)
 
-        return Response(CartSerializer(cart_item, many=False).data)
+        return Response({"id": cart_id, "product_item_id": int(data["product_item_id"])})
 
     if request.method == "DELETE":
-        request.user.cart_set.get(
-            product_item_id=ProductItem.objects.get(id=data["product_item_id"]),
-            size_id=Size.objects.get(size=data["size"])
-        ).delete()
+        request.user.cart_set.filter(product_item_id=data["product_item_id"], size_id=size_id).delete()
+
+    return Response({"message": "Successfully!"})
 
 
 @api_view(["DELETE"])
@@ -213,13 +240,14 @@ def get_orders_to_admin(request):
         [
             order.get_detail_info()
             for order in Order.objects.filter(state__in=["In progress", "Accepted"])
+            .select_related("user_id__userinfo").prefetch_related("orderline_set")
         ]
     )
 
 
 @api_view(["GET"])
 def get_order_to_admin_by_pk(request, pk):
-    order = Order.objects.get(id=pk)
+    order = Order.objects.select_related("user_id__userinfo").prefetch_related("orderline_set").get(id=pk)
 
     return Response(order.get_detail_info())
 
@@ -237,29 +265,10 @@ def manage_order(request, pk):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def create_order(request):
-    product_list = []
-    customer = Customer.objects.get(id=request.user.id)
-
-
-    order = Order.objects.create(
-        user_id=request.user,
-        products_list=JSONRenderer().render([
-            c.get_order_info() for c in customer.cart_set.all()
-        ]),
-        office_address=request.data["office"]
-    )
-
-    BalanceHistory.objects.create(
-        user_id=request.user,
-        action="EX",
-        category="OR",
-        category_id=order.id,
-        ucoin_count=request.data["totalSum"] if request.data.get("totalSum") else 0
-    )
-
-    customer.clear_cart()
-
-    if request.data.get("totalSum"):
-        request.user.userinfo.change_balance(request.data["totalSum"], "remove")
+    # the total is computed from product prices, "totalSum" sent by the client is not used
+    try:
+        order = checkout(request.user, request.data["office"])
+    except (EmptyCart, NotEnoughUcoins) as e:
+        return Response({"error_message": str(e)}, status=400)
 
     return Response({"order_id": order.id})
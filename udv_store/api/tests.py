@@ -1,3 +1,349 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import ImportJob, UserInfo, BalanceHistory, Present, Activity, UcoinRequest
+from .store_models import Product, ProductItem, ProductPhoto, Size, Cart, Order, OrderLine
+from .utils.catalog_cache import bump_catalog_version
+from .utils.checkout import checkout
+from .utils.jobs import claim_job
+from .utils.ledger import post_entries, NotEnoughUcoins
+from .utils.sizes import refresh_sizes
+
+
+class CatalogQueryCountTests(TestCase):
+    """
+    Catalog pages are read in a fixed number of queries, whatever the number of products, items and photos.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("buyer", password="password"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sizes = [Size.objects.create(size=name) for name in ("S", "M", "L")]
+        refresh_sizes()
+
+    def add_products(self, count: int, colors: int):
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(count):
+                product = Product.objects.create(
+                    name=f"Product {number}", price=10, description="", state=Product.StateChoice.actual
+                )
+                for color in range(colors):
+                    item = ProductItem.objects.create(product_id=product, color=f"color {color}")
+                    item.sizes.add(*self.sizes)
+                    for _ in range(2):
+                        ProductPhoto.objects.create(product_item=item, photo="images/photo.png",
+                                                    created_date=timezone.now())
+        return product
+
+    def get(self, url: str):
+        # the page is rendered again instead of being taken from the catalog cache
+        bump_catalog_version()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_constant_queries(self, url_of):
+        product = self.add_products(2, colors=2)
+        with CaptureQueriesContext(connection) as small_catalog:
+            self.get(url_of(product))
+
+        product = self.add_products(10, colors=6)
+        with self.assertNumQueries(len(small_catalog)):
+            self.get(url_of(product))
+
+    def test_store_products(self):
+        self.assert_constant_queries(lambda product: "/api/store/products/")
+
+    def test_product_page(self):
+        self.assert_constant_queries(lambda product: f"/api/store/products/{product.product_id}/")
+
+    def test_admin_product_items(self):
+        self.assert_constant_queries(lambda product: f"/api/admin/products/{product.product_id}/items/")
+
+    def test_store_products_lists_all_items(self):
+        self.add_products(3, colors=2)
+        products = self.get("/api/store/products/").json()
+        self.assertEqual(len(products), 3)
+
+
+class ProductAvailabilityTransactionTests(TransactionTestCase):
+    """
+    Items are saved outside of any transaction here, like in the views running in autocommit mode.
+    """
+
+    def test_item_created_outside_of_transaction(self):
+        product = Product.objects.create(name="Product", price=10, description="", state=Product.StateChoice.actual)
+
+        # sqlite ignores select_for_update, it is checked like on postgres without adding FOR UPDATE to the query
+        with mock.patch.object(connection.features, "has_select_for_update", True), \
+                mock.patch.object(connection.ops, "for_update_sql", return_value=""):
+            ProductItem.objects.create(product_id=product, color="black")
+
+        product.refresh_from_db()
+        self.assertEqual(product.items_total, 1)
+
+
+class ImportJobTests(TestCase):
+    def test_claim_fails_jobs_of_dead_workers(self):
+        stale = ImportJob.objects.create(kind=ImportJob.KindChoice.parse_table, state=ImportJob.StateChoice.running)
+        alive = ImportJob.objects.create(kind=ImportJob.KindChoice.parse_table, state=ImportJob.StateChoice.running)
+        ImportJob.objects.filter(id=stale.id).update(last_date=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(claim_job())
+
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.state, ImportJob.StateChoice.failed)
+        self.assertNotEqual(stale.error_message, "")
+        self.assertEqual(alive.state, ImportJob.StateChoice.running)
+
+    def test_claim_takes_queued_job(self):
+        job = ImportJob.objects.create(kind=ImportJob.KindChoice.parse_table)
+        self.assertEqual(claim_job().id, job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.state, ImportJob.StateChoice.running)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", password="password")
+        UserInfo.objects.create(user_id=self.user, first_name="Иван", last_name="Петров", balance=100)
+        self.product = Product.objects.create(name="Product", price=30, description="",
+                                              state=Product.StateChoice.actual)
+        self.black = ProductItem.objects.create(product_id=self.product, color="black")
+        self.white = ProductItem.objects.create(product_id=self.product, color="white")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def balance(self) -> int:
+        return UserInfo.objects.get(user_id=self.user).balance
+
+    def test_total_is_computed_from_product_prices(self):
+        Cart.add_item(self.user.id, self.black.id, None)
+        Cart.add_item(self.user.id, self.black.id, None)
+
+        response = self.client.post("/api/store/create/order/", {"office": "LA", "totalSum": 1}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(id=response.data["order_id"])
+        self.assertEqual(order.total_price, 60)
+        self.assertEqual(list(order.orderline_set.values_list("color", "price", "count")), [("black", 30, 2)])
+        self.assertEqual(self.balance(), 40)
+        self.assertTrue(BalanceHistory.objects.filter(category="OR", category_id=order.id, ucoin_count=60).exists())
+        self.assertFalse(Cart.objects.filter(user_id=self.user).exists())
+
+    def test_not_enough_ucoins_changes_nothing(self):
+        for _ in range(4):
+            Cart.add_item(self.user.id, self.black.id, None)
+
+        response = self.client.post("/api/store/create/order/", {"office": "LA", "totalSum": 100}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLine.objects.exists())
+        self.assertFalse(BalanceHistory.objects.exists())
+        self.assertEqual(list(Cart.objects.values_list("count", flat=True)), [4])
+        self.assertEqual(self.balance(), 100)
+
+    def test_zero_count_lines_are_not_ordered(self):
+        Cart.add_item(self.user.id, self.black.id, None)
+        Cart.add_item(self.user.id, self.white.id, None)
+        Cart.objects.filter(product_item_id=self.white).change_count("remove")
+
+        order = checkout(self.user, "LA")
+
+        self.assertEqual(list(order.orderline_set.values_list("color", "count")), [("black", 1)])
+        self.assertEqual(order.total_price, 30)
+        self.assertFalse(Cart.objects.filter(user_id=self.user).exists())
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user("sender", password="password")
+        self.recipient = User.objects.create_user("recipient", password="password")
+        for user in (self.sender, self.recipient):
+            UserInfo.objects.create(user_id=user, first_name="Иван", last_name=user.username, balance=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+
+    def balances(self) -> tuple:
+        return tuple(UserInfo.objects.get(user_id=user).balance for user in (self.sender, self.recipient))
+
+    def entry(self, user, action: str, ucoin_count: int) -> BalanceHistory:
+        return BalanceHistory(user_id=user, action=action, category="PR", category_id=1, ucoin_count=ucoin_count)
+
+    def send_present(self, user_to, ucoin_count: int):
+        return self.client.post("/api/store/create/present/", {
+            "user_to": user_to.id, "text": "Спасибо!", "ucoin_count": ucoin_count, "background": "blue"
+        }, format="json")
+
+    def test_overdraft_raises_and_writes_nothing(self):
+        with self.assertRaises(NotEnoughUcoins):
+            post_entries([self.entry(self.sender, "EX", 150), self.entry(self.recipient, "AD", 150)])
+
+        self.assertEqual(self.balances(), (100, 100))
+        self.assertFalse(BalanceHistory.objects.exists())
+
+    def test_non_positive_amount_raises(self):
+        for ucoin_count in (0, -50):
+            with self.assertRaises(ValueError):
+                post_entries([self.entry(self.recipient, "AD", ucoin_count)])
+
+        self.assertEqual(self.balances(), (100, 100))
+        self.assertFalse(BalanceHistory.objects.exists())
+
+    def test_entries_change_balances(self):
+        balances = post_entries([self.entry(self.sender, "EX", 30), self.entry(self.recipient, "AD", 30)])
+
+        self.assertEqual(balances, {self.sender.id: 70, self.recipient.id: 130})
+        self.assertEqual(self.balances(), (70, 130))
+        self.assertEqual(BalanceHistory.objects.count(), 2)
+
+    def test_present_moves_ucoins_from_sender_to_recipient(self):
+        response = self.send_present(self.recipient, 30)
+
+        self.assertEqual(response.status_code, 200)
+        present = Present.objects.get()
+        self.assertEqual(self.balances(), (70, 130))
+        self.assertEqual(
+            set(BalanceHistory.objects.filter(category="PR", category_id=present.id)
+                .values_list("user_id", "action", "ucoin_count")),
+            {(self.sender.id, "EX", 30), (self.recipient.id, "AD", 30)}
+        )
+        self.assertEqual(UserInfo.objects.get(user_id=self.recipient).unread_present_count, 1)
+
+    def test_present_to_yourself_nets_to_zero(self):
+        response = self.send_present(self.sender, 30)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balances(), (100, 100))
+        self.assertEqual(BalanceHistory.objects.filter(user_id=self.sender).count(), 2)
+
+    def test_present_without_enough_ucoins_is_not_saved(self):
+        response = self.send_present(self.recipient, 150)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Present.objects.exists())
+        self.assertFalse(BalanceHistory.objects.exists())
+        self.assertEqual(self.balances(), (100, 100))
+        self.assertEqual(UserInfo.objects.get(user_id=self.recipient).unread_present_count, 0)
+
+    def test_present_with_non_positive_amount_is_rejected(self):
+        response = self.send_present(self.recipient, -50)
+
+        self.assertNotEqual(response.status_code, 200)
+        self.assertIn("ucoin_count", response.data)
+        self.assertFalse(Present.objects.exists())
+        self.assertEqual(self.balances(), (100, 100))
+
+
+class RequestsBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("employee", password="password")
+        UserInfo.objects.create(user_id=self.user, first_name="Иван", last_name="Петров", balance=0)
+        activity = Activity.objects.create(name="Activity", ucoins_count=20, description="")
+        self.first, self.second = [UcoinRequest.objects.create(user_id=self.user, activity_id=activity, comment="")
+                                   for _ in range(2)]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("admin", password="password"))
+
+    def process(self, decisions):
+        return self.client.post("/api/admin/requests/batch/", {"requests": decisions}, format="json")
+
+    def balance(self) -> int:
+        return UserInfo.objects.get(user_id=self.user).balance
+
+    def test_accept_and_reject(self):
+        response = self.process([
+            {"request_id": self.first.request_id, "action": "accept"},
+            {"request_id": self.second.request_id, "action": "reject", "rejected_comment": "Нет фото"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"accepted": 1, "rejected": 1, "skipped": []})
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.state, "AC")
+        self.assertEqual((self.second.state, self.second.rejected_comment), ("RJ", "Нет фото"))
+        self.assertEqual(self.balance(), 20)
+
+    def test_repeated_accept_is_skipped_and_paid_once(self):
+        decisions = [{"request_id": self.first.request_id, "action": "accept"}]
+        self.process(decisions)
+        response = self.process(decisions)
+
+        self.assertEqual(response.data, {"accepted": 0, "rejected": 0, "skipped": [self.first.request_id]})
+        self.assertEqual(self.balance(), 20)
+        self.assertEqual(BalanceHistory.objects.filter(category="RQ").count(), 1)
+
+    def test_unknown_requests_are_skipped(self):
+        response = self.process([{"request_id": 999999, "action": "reject"}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"accepted": 0, "rejected": 0, "skipped": [999999]})
+
+    def test_malformed_input_is_rejected(self):
+        for decisions in (
+            [{"request_id": self.first.request_id, "action": "accepted"}],
+            [{"action": "accept"}],
+            [{"request_id": "first", "action": "accept"}],
+            [self.first.request_id],
+            "accept",
+        ):
+            self.assertEqual(self.process(decisions).status_code, 400, decisions)
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.state, "IR")
+        self.assertEqual(self.balance(), 0)
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", password="password")
+        product = Product.objects.create(name="Product", price=30, description="")
+        self.item = ProductItem.objects.create(product_id=product, color="black")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.size = Size.objects.create(size="M")
+        refresh_sizes()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_add_item_increments_the_line_of_a_size(self):
+        first = Cart.add_item(self.user.id, self.item.id, self.size.id)
+        second = Cart.add_item(self.user.id, self.item.id, self.size.id)
+
+        self.assertEqual(first, second)
+        self.assertEqual(list(Cart.objects.values_list("size_id", "count")), [(self.size.id, 2)])
+
+    def test_add_item_increments_the_line_without_size(self):
+        first = Cart.add_item(self.user.id, self.item.id, None)
+        second = Cart.add_item(self.user.id, self.item.id, None)
+
+        self.assertEqual(first, second)
+        self.assertEqual(list(Cart.objects.values_list("size_id", "count")), [(None, 2)])
+
+    def test_lines_of_different_sizes_are_kept_apart(self):
+        Cart.add_item(self.user.id, self.item.id, None)
+        Cart.add_item(self.user.id, self.item.id, self.size.id)
+
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_unknown_item_is_not_added(self):
+        self.assertIsNone(Cart.add_item(self.user.id, self.item.id + 1, None))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_unknown_item_answers_400(self):
+        # TestCase runs the request inside a transaction, like ATOMIC_REQUESTS would
+        response = self.client.post("/api/store/cart/items/", {"product_item_id": self.item.id + 1, "size": "M"},
+                                    format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
@@ -1,8 +1,8 @@
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import get_user_info, create_request, BalanceAPIView, \
-    get_requests_in_progress, process_request, search_user, get_requests_full, get_request_latest, \
-    get_unread_present_count, get_unread_present_list, \
+    get_requests_in_progress, process_request, process_requests_batch, search_user, get_requests_full, get_request_latest, \
+    get_unread_present_count, wait_unread_present_count, get_unread_present_list, \
     get_present_list, create_present, manage_present_by_pk, \
     get_balance_history, \
     create_user, create_user_by_table, get_moderator_list, manage_moderator, \
@@ -12,10 +12,10 @@ from .store_views import get_user_orders_latest, get_user_orders_full, create_or
     get_items_list_to_admin, manage_item, create_item, \
     get_products_to_store, get_items_to_product_page, \
     get_orders_to_admin, get_order_to_admin_by_pk, manage_order, \
-    get_cart, manage_cart_by_pk, manage_cart
+    get_cart, get_full_cart, manage_cart_by_pk, manage_cart
 from .views import MyTokenObtainPairView
 
-from .views import TableUploadAPI, create_users_by_table
+from .views import TableUploadAPI, create_users_by_table, get_import_job, export_imported_users
 
 urlpatterns = [
     # Authentication token
@@ -24,6 +24,7 @@ urlpatterns = [
 
     # User personal info
     path("userbalance/", BalanceAPIView.as_view(), name="user-balance"),
+    path("userinfo/unread-presents/wait/", wait_unread_present_count, name="user-unread-present-count-wait"),
     path("userinfo/unread-presents/", get_unread_present_count, name="user-unread-present-count"),
     path("userinfo/", get_user_info, name="user-info"),
     path("userhistory/request/full/", get_requests_full, name="user-requests-full"),
@@ -48,6 +49,7 @@ urlpatterns = [
 
     path("store/cart/items/<str:pk>/", manage_cart_by_pk, name="manage-cart-item-by-index"),
     path("store/cart/items/", manage_cart, name="manage-cart-item"),
+    path("store/cart/", get_full_cart, name="get-full-cart"),
     path("store/cart/<str:param>/", get_cart, name="get-cart"),
 
 
@@ -57,6 +59,8 @@ urlpatterns = [
     path("admin/create/user/", create_user, name="create-user"),
     path("admin/create/user_by_file/", TableUploadAPI.as_view()),
     path("admin/create/user_by_file/accept/", create_users_by_table),
+    path("admin/create/user_by_file/jobs/<str:pk>/", get_import_job, name="import-job"),
+    path("admin/imported-users/export/", export_imported_users, name="export-imported-users"),
 
     path("admin/products/",
          get_products_to_admin, name="get-products-admin"),
@@ -72,6 +76,7 @@ urlpatterns = [
     path("admin/orders/<str:pk>/", get_order_to_admin_by_pk, name="get-order-by-pk"),
     path("admin/orders/", get_orders_to_admin, name="get-orders"),
 
+    path("admin/requests/batch/", process_requests_batch, name="process-requests-batch"),
     path("admin/requests/<str:pk>/", process_request, name="process-request"),
     path("admin/requests/", get_requests_in_progress, name="get-requests"),
 
@@ -0,0 +1,20 @@
+import time
+
+# Helpers of the benchmark_* management commands.
+
+
+def timed(function, *args, **kwargs) -> tuple:
+    # returns the result of the call and the seconds it took
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(timings: list, share: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def format_timings(timings: list) -> str:
+    return f"p50 {percentile(timings, 0.5) * 1000:.2f} ms, p99 {percentile(timings, 0.99) * 1000:.2f} ms, " \
+           f"total {sum(timings):.3f} s"
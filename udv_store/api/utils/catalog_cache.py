@@ -0,0 +1,62 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .sizes import refresh_sizes
+from .versions import get_version, bump_version, versions_shared, is_stale
+
+# Pre-rendered JSON pages of the store catalog.
+# Every page is stored under the current catalog version, so bumping the version
+# invalidates the local tier of every worker and the shared tier at once.
+# Without a shared versions cache the shared tier is not used and local pages expire, see versions.local_ttl.
+_local_pages = {}
+_local_version = None
+_lock = threading.Lock()
+
+
+def shared_cache():
+    alias = getattr(settings, "CATALOG_CACHE_ALIAS", None)
+    return caches[alias] if alias and versions_shared() else None
+
+
+def catalog_version() -> int:
+    return get_version("catalog")
+
+
+def bump_catalog_version() -> int:
+    return bump_version("catalog")
+
+
+def get_catalog_page(key: str, render) -> bytes:
+    global _local_version
+
+    version = catalog_version()
+
+    with _lock:
+        if _local_version != version:
+            _local_pages.clear()
+            _local_version = version
+        payload, cached_at = _local_pages.get(key, (None, None))
+
+    if payload is not None and not is_stale(cached_at):
+        return payload
+    payload = None
+
+    shared = shared_cache()
+    shared_key = f"catalog:{version}:{key}"
+    if shared is not None:
+        payload = shared.get(shared_key)
+
+    if payload is None:
+        refresh_sizes()
+        payload = render()
+        if shared is not None:
+            shared.set(shared_key, payload, timeout=getattr(settings, "CATALOG_CACHE_TIMEOUT", 60 * 60 * 24))
+
+    with _lock:
+        if _local_version == version:
+            _local_pages[key] = payload, time.monotonic()
+
+    return payload
@@ -0,0 +1,52 @@
+from django.db import transaction
+
+from ..models import BalanceHistory
+from ..store_models import Order, OrderLine, Cart
+from .ledger import post_entries
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def checkout(user, office_address: str) -> Order:
+    """
+    Turn the cart of the user into an order in one transaction.
+    Prices are taken from the products, the total is debited through the ledger,
+    order lines are written with bulk_create and the cart lines are deleted with one DELETE.
+    Raises EmptyCart or NotEnoughUcoins, nothing is written then.
+    """
+    with transaction.atomic():
+        # cart lines are locked, so the same cart can't be ordered twice by concurrent requests.
+        # lines taken down to zero stay in the cart, they are deleted with the others but not ordered
+        cart_lines = list(Cart.objects.filter(user_id=user).with_products().select_for_update(of=("self",)))
+        ordered_lines = [c for c in cart_lines if c.count > 0]
+        if not ordered_lines:
+            raise EmptyCart("Корзина пуста")
+
+        order_lines = [c.get_order_line() for c in ordered_lines]
+        order = Order.objects.create(
+            user_id=user,
+            total_price=sum(line.price * line.count for line in order_lines),
+            office_address=office_address
+        )
+
+        for line in order_lines:
+            line.order_id = order
+        OrderLine.objects.bulk_create(order_lines)
+
+        # the ledger takes only positive amounts, free orders change no balance
+        if order.total_price > 0:
+            post_entries([
+                BalanceHistory(
+                    user_id=user,
+                    action="EX",
+                    category="OR",
+                    category_id=order.id,
+                    ucoin_count=order.total_price
+                )
+            ])
+
+        Cart.objects.filter(id__in=[c.id for c in cart_lines]).delete()
+
+    return order
@@ -0,0 +1,67 @@
+from hashlib import md5
+
+from django.db.models import Count, Max, Q
+
+from .catalog_cache import catalog_version
+from ..models import Activity
+
+# Cheap change markers for conditional GET.
+# A marker is a single aggregate query (row count, newest created_date and,
+# for models with a state, row count per state), so an unchanged list gets
+# "304 Not Modified" without being loaded or serialized.
+
+
+def _marker(request, name, queryset, date_field="created_date", state_field=None):
+    # etag and last_modified functions of one view share a single aggregate query
+    markers = getattr(request, "_change_markers", None)
+    if markers is None:
+        markers = request._change_markers = {}
+    if name not in markers:
+        aggregates = {"count": Count("pk"), "last": Max(date_field)}
+        if state_field:
+            for state, _ in queryset.model._meta.get_field(state_field).choices:
+                aggregates["state_" + state] = Count("pk", filter=Q(**{state_field: state}))
+        markers[name] = queryset.order_by().aggregate(**aggregates)
+    return markers[name]
+
+
+def _etag(request, *parts):
+    # paginated lists differ by cursor, so the query string is part of the tag
+    return md5(repr((request.GET.urlencode(), *parts)).encode()).hexdigest()
+
+
+def catalog_etag(request, pk=None):
+    return _etag(request, "catalog", catalog_version(), pk)
+
+
+def activities_etag(request):
+    return _etag(request, "activities", *_marker(request, "activities", Activity.objects.all(), "last_date").values())
+
+
+def activities_last_modified(request):
+    return _marker(request, "activities", Activity.objects.all(), "last_date")["last"]
+
+
+def requests_etag(request):
+    marker = _marker(request, "requests", request.user.ucoinrequest_set.all(), state_field="state")
+    return _etag(request, "requests", request.user.id, *marker.values())
+
+
+def orders_etag(request):
+    marker = _marker(request, "orders", request.user.order_set.all(), state_field="state")
+    return _etag(request, "orders", request.user.id, *marker.values())
+
+
+def presents_etag(request):
+    marker = _marker(request, "presents", request.user.present_set.all(), state_field="state")
+    return _etag(request, "presents", request.user.id, *marker.values())
+
+
+# Balance history is append-only, so its newest created_date is also a valid Last-Modified.
+# Requests, orders and presents change state after creation and only get an ETag.
+def balance_history_etag(request):
+    return _etag(request, "balance", request.user.id, *_marker(request, "balance", request.user.balancehistory_set.all()).values())
+
+
+def balance_history_last_modified(request):
+    return _marker(request, "balance", request.user.balancehistory_set.all())["last"]
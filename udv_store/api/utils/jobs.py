@@ -0,0 +1,82 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ImportJob
+
+# Table imports run outside of the HTTP request: views create an ImportJob
+# and the run_import_jobs management command executes queued jobs one by one.
+
+
+def run_parse_table(job: ImportJob, report) -> dict:
+    from .table_parser import parse_data_from_file
+
+    file_path = job.params["file_path"]
+    try:
+        with open(file_path, "rb") as table_file:
+            response = parse_data_from_file(
+                table_file, job.params["table_settings"], job.params["table_format"], report
+            )
+    finally:
+        os.remove(file_path)
+
+    if type(response) == str:
+        raise ValueError(response)
+    report(response["rows_count"], response["rows_count"])
+    return response
+
+
+def run_register_users(job: ImportJob, report) -> dict:
+    from .register_user import register_users
+
+    return {"message": register_users(job.params["delete_users"], job.params["table_name"], report)}
+
+
+HANDLERS = {
+    ImportJob.KindChoice.parse_table: run_parse_table,
+    ImportJob.KindChoice.register_users: run_register_users,
+}
+
+
+def fail_stale_jobs() -> int:
+    # a worker killed mid-job (OOM, deploy) leaves it running, so jobs without a report for too long are failed
+    timeout = timedelta(seconds=getattr(settings, "IMPORT_JOB_TIMEOUT", 15 * 60))
+    with transaction.atomic():
+        stale = list(
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(state=ImportJob.StateChoice.running, last_date__lt=timezone.now() - timeout)
+            .values_list("id", flat=True)
+        )
+        return ImportJob.objects.filter(id__in=stale).update(
+            state=ImportJob.StateChoice.failed,
+            error_message="Задача прервана: обработчик перестал отвечать",
+            last_date=timezone.now()
+        )
+
+
+def claim_job():
+    fail_stale_jobs()
+    # skip_locked lets several workers take different jobs from the same queue
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update(skip_locked=True).filter(state=ImportJob.StateChoice.queued).first()
+        if job is not None:
+            job.state = ImportJob.StateChoice.running
+            job.save(update_fields=["state", "last_date"])
+    return job
+
+
+def run_job(job: ImportJob):
+    def report(done: int, total: int):
+        ImportJob.objects.filter(id=job.id).update(progress=done, total=total, last_date=timezone.now())
+
+    try:
+        job.result = HANDLERS[job.kind](job, report)
+        job.state = ImportJob.StateChoice.done
+    except Exception as e:
+        job.error_message = str(e)
+        job.state = ImportJob.StateChoice.failed
+
+    job.save(update_fields=["state", "result", "error_message", "last_date"])
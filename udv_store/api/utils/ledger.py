@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value
+
+from ..models import UserInfo, BalanceHistory
+
+
+class NotEnoughUcoins(Exception):
+    pass
+
+
+def post_entries(entries: list) -> dict:
+    """
+    Apply unsaved BalanceHistory entries to user balances in one transaction.
+    Balances of all affected users are locked, changed by a single UPDATE and
+    the entries are written with bulk_create. Returns {user_id: new balance}.
+    """
+    deltas = defaultdict(int)
+    for entry in entries:
+        if entry.ucoin_count <= 0:
+            raise ValueError(f"Ucoin count of a balance entry must be positive, got {entry.ucoin_count}")
+        deltas[entry.user_id_id] += entry.ucoin_count if entry.action == "AD" else -entry.ucoin_count
+
+    with transaction.atomic():
+        # rows are locked in user_id order, so concurrent transfers can't deadlock
+        balances = dict(
+            UserInfo.objects.select_for_update()
+            .filter(user_id__in=deltas.keys()).order_by("user_id")
+            .values_list("user_id", "balance")
+        )
+
+        new_balances = {user_id: balances[user_id] + delta for user_id, delta in deltas.items()}
+        for user_id, balance in new_balances.items():
+            if balance < 0:
+                raise NotEnoughUcoins(f"Not enough ucoins on the balance of user {user_id}")
+
+        changed = [user_id for user_id, delta in deltas.items() if delta]
+        if changed:
+            UserInfo.objects.filter(user_id__in=changed).update(
+                balance=F("balance") + Case(
+                    *[When(user_id=user_id, then=Value(deltas[user_id])) for user_id in changed],
+                    default=Value(0)
+                )
+            )
+
+        BalanceHistory.objects.bulk_create(entries)
+
+    return new_balances
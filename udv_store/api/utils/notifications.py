@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Pub/sub for "new present" events.
+# Long-poll requests subscribe with the user id and await the returned future,
+# create_present publishes after its transaction commits. The backend is chosen by
+# the PRESENT_NOTIFICATIONS_BACKEND setting (dotted path to a class with
+# subscribe/unsubscribe/publish), so a multi-worker deployment can plug in a
+# broker shared between processes.
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class InProcessBackend:
+    """Delivers events to long-poll requests waiting in the current process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    def subscribe(self, user_id) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters[user_id].add(future)
+        return future
+
+    def unsubscribe(self, user_id, future: asyncio.Future):
+        with self._lock:
+            waiters = self._waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[user_id]
+
+    def publish(self, user_id, event: dict):
+        with self._lock:
+            waiters = list(self._waiters.get(user_id, ()))
+        # publish is called from sync views running in worker threads
+        for future in waiters:
+            try:
+                future.get_loop().call_soon_threadsafe(_resolve, future, event)
+            except RuntimeError:
+                # the loop of a timed out long poll may be closed before it unsubscribed
+                pass
+
+
+def _resolve(future: asyncio.Future, event: dict):
+    if not future.done():
+        future.set_result(event)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, "PRESENT_NOTIFICATIONS_BACKEND",
+                                  "api.utils.notifications.InProcessBackend")
+                _broker = import_string(backend)()
+    return _broker
+
+
+def publish_present(present):
+    get_broker().publish(present.user_to_id, {"event": "present", "present_id": present.id})
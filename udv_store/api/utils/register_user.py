@@ -1,31 +1,65 @@
-import pandas as pd
-from datetime import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from api.models import UserInfo
-import os
-
-
-def register_users(delete_users: list, temp_table: str):
-    cols = ["last_name", "first_name", "patronymic", "balance", "generated_username"]
-    df = pd.read_csv("media/tables/" + temp_table, usecols=cols)
-    df = df[~df["generated_username"].isin(delete_users)]
-    user_info = df.to_dict()
-
-    for i in df.index:
-        user = User.objects.create_user(username=user_info["generated_username"][i],
-                                        password="tempPas_" + user_info["generated_username"][i])
-        UserInfo.objects.create(user_id=user, balance=user_info["balance"][i],
-                                first_name=user_info["first_name"][i],
-                                last_name=user_info["last_name"][i],
-                                patronymic=user_info["patronymic"][i],
-                                )
-    os.remove("media/tables/" + temp_table)
-
-    # main_table_path = "../../storage/tables/Пользователи из загруженных таблиц.xlsx"
-    main_table_path = "media/tables/Пользователи из загруженных таблиц.xlsx"
-    registered_users = pd.read_excel(main_table_path, usecols=[*cols, "date"], engine='openpyxl')
-    df["date"] = [str(datetime.now().date())] * len(df)
-
-    pd.concat([registered_users, df]).to_excel(main_table_path, engine='openpyxl')
+from django.db import transaction
+from api.models import UserInfo, ImportedUser
+from .staging import read_staging, staging_rows, remove_staging
+from .user_index import invalidate_user_index
+
+CHUNK_SIZE = 1000
+
+
+def hash_passwords(passwords: list) -> list:
+    # PBKDF2 is CPU-bound, so hashes of a big table are computed by a pool of processes.
+    # Forked workers inherit configured django settings, without fork it is done in place.
+    if len(passwords) < 100 or "fork" not in multiprocessing.get_all_start_methods():
+        return [make_password(password) for password in passwords]
+
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork")) as pool:
+        return list(pool.map(make_password, passwords, chunksize=50))
+
+
+def register_users(delete_users: list, temp_table: str, progress=None):
+    delete_users = set(delete_users)
+    total = staging_rows(temp_table)
+    done = 0
+
+    with transaction.atomic():
+        for df in read_staging(temp_table):
+            done += len(df)
+            rows = df[~df["generated_username"].isin(delete_users)].to_dict("records")
+            passwords = hash_passwords(["tempPas_" + row["generated_username"] for row in rows])
+
+            for start in range(0, len(rows), CHUNK_SIZE):
+                chunk = rows[start:start + CHUNK_SIZE]
+
+                User.objects.bulk_create([
+                    User(username=row["generated_username"], password=password)
+                    for row, password in zip(chunk, passwords[start:start + CHUNK_SIZE])
+                ])
+                user_ids = dict(
+                    User.objects.filter(username__in=[row["generated_username"] for row in chunk])
+                    .values_list("username", "id")
+                )
+                UserInfo.objects.bulk_create([
+                    UserInfo(user_id_id=user_ids[row["generated_username"]], balance=int(row["balance"]),
+                             first_name=row["first_name"], last_name=row["last_name"],
+                             patronymic=row["patronymic"]).fill_search_keys()
+                    for row in chunk
+                ])
+                ImportedUser.objects.bulk_create([
+                    ImportedUser(user_id_id=user_ids[row["generated_username"]], balance=int(row["balance"]),
+                                 first_name=row["first_name"], last_name=row["last_name"],
+                                 patronymic=row["patronymic"], username=row["generated_username"])
+                    for row in chunk
+                ])
+
+            if progress is not None:
+                progress(done, total)
+
+    # bulk_create sends no post_save, so the typeahead indexes of all processes are rebuilt instead
+    invalidate_user_index()
+    remove_staging(temp_table)
 
     return "Successfully!"
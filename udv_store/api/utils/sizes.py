@@ -0,0 +1,130 @@
+import time
+
+from django.conf import settings
+
+from .versions import get_version, bump_version, is_stale
+
+# Registry of sizes. The Size table is read once per process and reloaded when the version is bumped,
+# so resolving a size by name or id costs no queries. The version itself is checked at most once
+# per SIZES_VERSION_CHECK_INTERVAL seconds, not on every lookup.
+NO_SIZE = "No size"
+SIZE_ORDER = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
+# positions a size can take in ProductItem.size_mask, the sign bit of the bigint is never used
+SIZE_BITS = 63
+
+_size_ids = {}
+_size_names = {}
+_size_bits = {}
+_loaded_version = None
+_loaded_at = None
+_checked_at = None
+
+
+def sizes_version() -> int:
+    return get_version("sizes")
+
+
+def bump_sizes_version() -> int:
+    return bump_version("sizes")
+
+
+def size_sort_key(name: str) -> tuple:
+    # known sizes go in their canonical order, other ones after them by name, "No size" is the last
+    if name == NO_SIZE:
+        return 2, 0, name
+    if name in SIZE_ORDER:
+        return 0, SIZE_ORDER.index(name), name
+    return 1, 0, name
+
+
+def sort_sizes(names) -> list:
+    return sorted(names, key=size_sort_key)
+
+
+def _load(force=False, check=False):
+    global _size_ids, _size_names, _size_bits, _loaded_version, _loaded_at, _checked_at
+    now = time.monotonic()
+    interval = getattr(settings, "SIZES_VERSION_CHECK_INTERVAL", 1)
+    if not (force or check) and _checked_at is not None and now - _checked_at < interval:
+        return
+
+    version = sizes_version()
+    _checked_at = now
+    if force or version != _loaded_version or is_stale(_loaded_at):
+        from ..store_models import Size
+
+        sizes = sorted(Size.objects.values_list("id", "size", "bit"),
+                       key=lambda size: (size_sort_key(size[1]), size[0]))
+        ids = {}
+        for size_id, name, _ in sizes:
+            # if a name is repeated in the table, the oldest row is used
+            ids.setdefault(name, size_id)
+        _size_ids = ids
+        _size_names = {size_id: name for size_id, name, _ in sizes}
+        _size_bits = {size_id: bit for size_id, _, bit in sizes if bit is not None}
+        _loaded_version = version
+        _loaded_at = now
+
+
+def refresh_sizes():
+    # checks the version right away, pages that are cached for long are rendered after it
+    _load(check=True)
+
+
+def size_ids() -> dict:
+    _load()
+    return _size_ids
+
+
+def size_names() -> dict:
+    # ids to names, in the canonical order of the sizes
+    _load()
+    return _size_names
+
+
+def ordered_sizes() -> list:
+    return list(size_ids())
+
+
+def get_size_id(name: str):
+    return size_ids().get(name)
+
+
+def get_size_name(size_id):
+    return size_names().get(size_id)
+
+
+def require_size_id(name: str) -> int:
+    size_id = get_size_id(name)
+    if size_id is None:
+        # the size may have been added by the current transaction, the version is bumped only after commit
+        _load(force=True)
+        size_id = _size_ids.get(name)
+    if size_id is None:
+        from ..store_models import Size
+
+        raise Size.DoesNotExist(f"Size {name} does not exist")
+    return size_id
+
+
+def free_size_bit(used) -> int:
+    used = set(used)
+    bit = next((bit for bit in range(SIZE_BITS) if bit not in used), None)
+    if bit is None:
+        raise ValueError(f"All {SIZE_BITS} positions of sizes in ProductItem.size_mask are taken")
+    return bit
+
+
+def size_bit(size_id: int) -> int:
+    # bit of a size in ProductItem.size_mask, sizes take dense positions (Size.bit) instead of their ids
+    _load()
+    if size_id not in _size_bits:
+        _load(force=True)
+    if size_id not in _size_bits:
+        raise ValueError(f"Size {size_id} has no position in ProductItem.size_mask")
+    return 1 << _size_bits[size_id]
+
+
+def sizes_from_mask(mask: int) -> list:
+    _load()
+    return [name for size_id, name in _size_names.items() if mask >> _size_bits.get(size_id, SIZE_BITS) & 1]
@@ -0,0 +1,62 @@
+import json
+import os
+import re
+import shutil
+from uuid import uuid4
+
+import pandas as pd
+
+# Staging store for parsed tables waiting for the admin's confirmation.
+# A staged table is a directory of gzip-compressed JSON lines parts plus meta.json,
+# so it is written chunk by chunk while parsing and read back the same way.
+# Names come back from the client, so only the uuid names made by StagingWriter are accepted.
+STAGING_DIR = "media/tables/staging/"
+STAGING_NAME = re.compile(r"[0-9a-f]{32}")
+
+
+def is_staging_name(name) -> bool:
+    return isinstance(name, str) and STAGING_NAME.fullmatch(name) is not None
+
+
+def staging_path(name: str) -> str:
+    if not is_staging_name(name):
+        raise ValueError(f"Неверное имя временной таблицы: {name!r}")
+    return STAGING_DIR + name
+
+
+class StagingWriter:
+    def __init__(self):
+        self.name = uuid4().hex
+        self.parts = 0
+        self.rows = 0
+        os.makedirs(staging_path(self.name))
+
+    def append(self, df: pd.DataFrame):
+        df.to_json(f"{staging_path(self.name)}/part-{self.parts:05}.jsonl.gz", orient="records", lines=True,
+                   force_ascii=False, compression="gzip")
+        self.parts += 1
+        self.rows += len(df)
+
+    def close(self):
+        with open(f"{staging_path(self.name)}/meta.json", "w") as meta:
+            json.dump({"parts": self.parts, "rows": self.rows}, meta)
+
+
+def _meta(name: str) -> dict:
+    with open(f"{staging_path(name)}/meta.json") as meta:
+        return json.load(meta)
+
+
+def staging_rows(name: str) -> int:
+    return _meta(name)["rows"]
+
+
+def read_staging(name: str):
+    # dtype=False keeps the values as they were written, usernames and names are never turned into numbers
+    for part in range(_meta(name)["parts"]):
+        yield pd.read_json(f"{staging_path(name)}/part-{part:05}.jsonl.gz", orient="records", lines=True,
+                           dtype=False, compression="gzip")
+
+
+def remove_staging(name: str):
+    shutil.rmtree(staging_path(name), ignore_errors=True)
@@ -1,8 +1,12 @@
 import pandas as pd
-from math import isnan
-from .transliterator import transliterate as tr
+from functools import reduce
+from openpyxl import load_workbook
+from operator import or_
+from django.db.models import Q
+from .transliterator import transliterate_series
+from .staging import StagingWriter, remove_staging
+from django.conf import settings
 from django.contrib.auth.models import User
-from datetime import datetime
 
 
 # 1 test
@@ -15,88 +19,213 @@ from datetime import datetime
 # file_ = "fio_in_rows_and_balance_not_in_on_str.csv"
 # file_ = "fio_in_rows_without_balance.csv"
 
-def generate_username(*args):
-    username = tr('_'.join(*args))
-    users_with_same_username = User.objects.filter(username__startswith=username)
-    if users_with_same_username.exists():
-        username += "_" + str(users_with_same_username.count())
-    return username
+class UsernameAllocator:
+    """
+    Unique usernames for batches of base names. Existing usernames with the same
+    prefixes are fetched with one query per chunk, suffixes are assigned in memory,
+    so duplicates inside the batch (and inside earlier batches) get different usernames too.
+    """
 
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+        self.taken = set()
+        self.next_suffix = {}
+        self.checked_names = set()
 
-def parse_data_from_file(table_file, request: dict, csv: bool):
-    if not csv:
+    def allocate(self, base_names: list) -> list:
+        base_names = transliterate_series(pd.Series(base_names, dtype=object)).tolist()
+        new_names = [name for name in dict.fromkeys(base_names) if name not in self.checked_names]
+
+        for i in range(0, len(new_names), self.chunk_size):
+            prefixes = reduce(or_, (Q(username__startswith=name) for name in new_names[i:i + self.chunk_size]))
+            self.taken.update(User.objects.filter(prefixes).values_list("username", flat=True))
+        self.checked_names.update(new_names)
+
+        usernames = []
+        for name in base_names:
+            username = name
+            suffix = self.next_suffix.get(name, 0)
+            while username in self.taken:
+                suffix += 1
+                username = f"{name}_{suffix}"
+            self.next_suffix[name] = suffix
+            self.taken.add(username)
+            usernames.append(username)
+
+        return usernames
+
+
+def generate_usernames(base_names: list) -> list:
+    return UsernameAllocator().allocate(base_names)
+
+
+FIO_KEYS = ["last_name", "first_name", "patronymic"]
+FIO_LETTERS = {"ф": "last_name", "и": "first_name", "о": "patronymic"}
+
+
+def read_fio(df: pd.DataFrame, request: dict, cols: list) -> pd.DataFrame:
+    if request["fio_in_one_column"]:
+        fio_order = {FIO_LETTERS.get(char, ""): index for index, char in enumerate(request["fio_order"].lower())}
+        split_fio = df[cols[0]].astype(object).str.strip().str.split(expand=True).reindex(columns=range(3))
+        return pd.DataFrame({key: split_fio[fio_order[key]].astype(object) for key in FIO_KEYS})
+
+    return pd.DataFrame({key: df[cols[i]].astype(object) for i, key in enumerate(FIO_KEYS)})
+
+
+def read_people(df: pd.DataFrame, request: dict, cols: list) -> pd.DataFrame:
+    # the index of the result is the index of the fio row in the uploaded table
+    if request["table_have_balance"] and not request["fio_and_balance_in_one_row"]:
+        # the balance of a person is written in the first row after their fio row
+        is_fio = df[cols[0]].notna()
+        group = is_fio.cumsum()
+        is_balance = ~is_fio & (group > 0) & ~group.where(~is_fio).duplicated()
+
+        people = read_fio(df[is_fio], request, cols)
+        people_group = group[is_fio]
+        balance = df.loc[is_balance, cols[-1]].set_axis(group[is_balance])
+
+        people = people[people_group.isin(balance.index)]
+        people["balance"] = people_group.map(balance).fillna(0)
+        return people
+
+    people = read_fio(df, request, cols)
+    if request["table_have_balance"]:
+        people["balance"] = df[cols[-1]].fillna(0)
+    else:
+        people["balance"] = 0
+    return people
+
+
+def validate_people(people: pd.DataFrame):
+    balance = pd.to_numeric(people["balance"], errors="coerce")
+
+    problems = pd.Series("", index=people.index)
+    problems[balance.isna() | (balance < 0)] = "Некорректный баланс"
+    problems[people["first_name"].isna() | people["last_name"].isna()] = "Не удалось прочитать фамилию и имя"
+
+    invalid = problems != ""
+    # +2: the header is the first line of the table and lines are numbered from one
+    errors = [{"row": int(index) + 2, "message": message} for index, message in problems[invalid].items()]
+
+    people = people[~invalid].assign(balance=balance[~invalid])
+    return people, errors
+
+
+def split_incomplete_tail(chunk: pd.DataFrame, first_col: str):
+    # the balance row of the last person in a chunk may be in the next chunk
+    is_fio = chunk[first_col].notna().to_numpy()
+    if not is_fio.any():
+        return chunk, None
+    last_fio = len(is_fio) - 1 - is_fio[::-1].argmax()
+    return chunk.iloc[:last_fio], chunk.iloc[last_fio:]
+
+
+def read_xlsx_chunks(table_file, cols: list, chunk_size: int):
+    # read-only mode streams rows from the sheet xml instead of building the whole workbook
+    workbook = load_workbook(table_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        missing = [col for col in cols if col not in header]
+        if missing:
+            raise ValueError(f"В таблице нет столбцов: {', '.join(map(str, missing))}")
+        positions = [header.index(col) for col in cols]
+
+        index, values = [], []
+        # row numbers are kept as the index, so errors point to the right lines of the sheet
+        for row_number, row in enumerate(rows):
+            row_values = [row[position] if position < len(row) else None for position in positions]
+            if all(value is None for value in row_values):
+                continue
+            index.append(row_number)
+            values.append(row_values)
+            if len(values) == chunk_size:
+                yield pd.DataFrame(values, columns=cols, index=index)
+                index, values = [], []
+
+        if values:
+            yield pd.DataFrame(values, columns=cols, index=index)
+    finally:
+        workbook.close()
+
+
+def parse_data_from_file(table_file, request: dict, table_format: str, progress=None):
+    if table_format not in ("csv", "xlsx"):
         return "Загруженный файл имеет неправильный формат"
 
     cols = []
-    result = []
-    cur_dict = {}
-
-    def add_fio_to_dict(dict_: dict, in_one_column: bool, row_values: pd.Series):
-        if in_one_column:
-            fio_order = {}
-            for index, char in enumerate(request["fio_order"].lower()):
-                param = "first_name" if char in ["и", "И"] else "last_name" \
-                    if char in ["ф", "Ф"] else "patronymic" if char in ["о", "О"] else ""
-                fio_order[param] = index
-            split_fio = row_values[first_col_name].rstrip().rsplit()
-            for key in ["last_name", "first_name", "patronymic"]:
-                dict_[key] = split_fio[fio_order[key]]
-        else:
-            for i, value in enumerate(["last_name", "first_name", "patronymic"]):
-                dict_[value] = row_values[cols[i]]
 
     if request["fio_in_one_column"]:
         cols.append(request["fio_column_name"])
     else:
-        for key in ["last_name", "first_name", "patronymic"]:
+        for key in FIO_KEYS:
             cols.append(request["fio_columns_name"][key])
 
     if request["table_have_balance"]:
         cols.append(request["balance_column_name"])
 
-    # df = pd.DataFrame()
-    # if excel:
-    #     df = pd.read_excel(table_file, usecols=cols, engine='openpyxl')
-    df = pd.read_csv(table_file, usecols=cols, encoding='utf-8')
-
-    first_col_name = cols[0]
-
-    if request["table_have_balance"] and not request["fio_and_balance_in_one_row"]:
-        for index, row in df.iterrows():
-            if type(row[first_col_name]) != float:
-                add_fio_to_dict(cur_dict, request["fio_in_one_column"], row)
-            else:
-                cur_dict["balance"] = row[cols[-1]] if not isnan(row[cols[-1]]) else 0
-                result.append(cur_dict)
-                cur_dict = {}
+    chunk_size = getattr(settings, "IMPORT_CHUNK_SIZE", 10000)
+    preview_rows = getattr(settings, "IMPORT_PREVIEW_ROWS", 5000)
+    balance_in_next_row = request["table_have_balance"] and not request["fio_and_balance_in_one_row"]
+
+    allocator = UsernameAllocator()
+    staging = StagingWriter()
+    resulted_data = []
+    errors = []
+    errors_count = 0
+    rows_read = 0
+
+    def process(df: pd.DataFrame):
+        nonlocal errors_count
+
+        people, chunk_errors = validate_people(read_people(df, request, cols))
+        errors_count += len(chunk_errors)
+        errors.extend(chunk_errors[:max(0, preview_rows - len(errors))])
+
+        people["patronymic"] = people["patronymic"].fillna("")
+        base_names = people["last_name"].str.lower() + "_" + people["first_name"].str[:1] + "_" + \
+            people["patronymic"].str[:1]
+        people["generated_username"] = allocator.allocate(base_names.tolist())
+        people = people.reset_index(drop=True)
+
+        staging.append(people)
+
+        if len(resulted_data) < preview_rows:
+            resulted_data.extend(
+                people[["first_name", "last_name", "patronymic", "generated_username"]]
+                .head(preview_rows - len(resulted_data))
+                .rename(columns={"generated_username": "username"}).to_dict("records")
+            )
+
+    if table_format == "xlsx":
+        chunks = read_xlsx_chunks(table_file, cols, chunk_size)
     else:
-        for index, row in df.iterrows():
-            add_fio_to_dict(cur_dict, request["fio_in_one_column"], row)
-            if request["fio_and_balance_in_one_row"]:
-                cur_dict["balance"] = row[cols[-1]] if not isnan(row[cols[-1]]) else 0
-            else:
-                cur_dict["balance"] = 0
-            result.append(cur_dict)
-            cur_dict = {}
-
-    for item in result:
-        item["generated_username"] = generate_username([item["last_name"].lower(),
-                                                        item["first_name"][0], item["patronymic"][0]])
-
-        # item["generated_password"] = "tempPas_" + item["generated_username"]
-
-    temporary_table_name = "tempTable_" + str(datetime.now()) + ".csv"
-    pd.DataFrame(data=result).to_csv("media/tables/" + temporary_table_name)
-
-    # table_to_request = result.copy()
-
-    dict_to_request = [
-        {
-            "first_name": item["first_name"],
-            "last_name": item["last_name"],
-            "patronymic": item["patronymic"],
-            "username": item["generated_username"]
-        } for item in result
-    ]
-
-    return {"resulted_data": dict_to_request, "temporary_table_name": temporary_table_name}
+        chunks = pd.read_csv(table_file, usecols=cols, encoding='utf-8', chunksize=chunk_size)
+
+    tail = None
+    try:
+        for chunk in chunks:
+            rows_read += len(chunk)
+            if tail is not None:
+                chunk = pd.concat([tail, chunk])
+            if balance_in_next_row:
+                chunk, tail = split_incomplete_tail(chunk, cols[0])
+
+            process(chunk)
+            if progress is not None:
+                progress(rows_read, 0)
+
+        if tail is not None:
+            process(tail)
+    except Exception:
+        remove_staging(staging.name)
+        raise
+    staging.close()
+
+    return {
+        "resulted_data": resulted_data,
+        "rows_count": staging.rows,
+        "errors": errors,
+        "errors_count": errors_count,
+        "temporary_table_name": staging.name
+    }
@@ -1,13 +1,17 @@
+import re
+
+import pandas as pd
+
 transliterator = {
     "А": "A", "Б": "B", "В": "V", "Г": "G",
-    "Д": "F", "Е": "E", "Ё": "E", "Ж": "Zh",
+    "Д": "D", "Е": "E", "Ё": "E", "Ж": "Zh",
     "З": "Z", "И": "I", "Й": "I", "К": "K",
     "Л": "L", "М": "M", "Н": "N", "О": "O",
     "П": "P", "Р": "R", "С": "S", "Т": "T",
     "У": "U", "Ф": "F", "Х": "Kh", "Ц": "Ts",
     "Ч": "Ch", "Ш": "Sh", "Щ": "Shch", "Ъ": "Ie",
     "Ы": "Y", "Ь": "", "Э": "E", "Ю": "Iu",
-    "Я": "Ia", " ": " ", "_": "_",
+    "Я": "Ia",
 
     "а": "a", "б": "b", "в": "v", "г": "g",
     "д": "d", "е": "e", "ё": "e", "ж": "zh",
@@ -18,8 +22,56 @@ transliterator = {
     "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "ie",
     "ы": "y", "ь": "", "э": "e", "ю": "iu",
     "я": "ia",
+
+    # ukrainian and belarusian
+    "Є": "Ie", "І": "I", "Ї": "I", "Ґ": "G", "Ў": "U",
+    "є": "ie", "і": "i", "ї": "i", "ґ": "g", "ў": "u",
+
+    # kazakh
+    "Ә": "A", "Ғ": "G", "Қ": "K", "Ң": "N", "Ө": "O", "Ұ": "U", "Ү": "U", "Һ": "H",
+    "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u", "һ": "h",
+
+    "’": "", "ʼ": "",
 }
 
+# all values are ascii, so any non-ascii character left after translate() is unknown.
+# the table is a list indexed by code point: translate() looks it up faster than a dict,
+# characters without a mapping (latin letters, digits, "-", "_", spaces) map to themselves
+_mapping = str.maketrans(transliterator)
+TRANSLATION_TABLE = [_mapping.get(code, chr(code)) for code in range(max(_mapping) + 1)]
+UNKNOWN_CHARS = re.compile(r"[^\x00-\x7f]")
+
+
+def _unknown_chars_error(words) -> ValueError:
+    chars = sorted({char for word in words for char in UNKNOWN_CHARS.findall(word)})
+    return ValueError(f"Не удалось транслитерировать символы: {''.join(chars)}")
+
+
+def transliterate(word: str, fallback="") -> str:
+    """
+    Unknown characters are replaced with `fallback` (dropped by default), fallback=None raises ValueError.
+    """
+    result = word.translate(TRANSLATION_TABLE)
+    if result.isascii():
+        return result
+    if fallback is None:
+        raise _unknown_chars_error([result])
+    return UNKNOWN_CHARS.sub(fallback, result)
+
+
+def transliterate_series(series: pd.Series, fallback="") -> pd.Series:
+    # the whole column is joined into one string, so translate() runs once instead of once per row
+    present = series.notna()
+    values = series[present].tolist()
+    joined = "\x00".join(values).translate(TRANSLATION_TABLE)
+    if not joined.isascii():
+        if fallback is None:
+            raise _unknown_chars_error([joined])
+        joined = UNKNOWN_CHARS.sub(fallback, joined)
 
-def transliterate(rus_word: str) -> str:
-    return ''.join([transliterator[char] for char in rus_word])
+    if len(values) == len(series):
+        return pd.Series(joined.split("\x00") if values else [], index=series.index, name=series.name, dtype=object)
+    result = series.copy()
+    if values:
+        result[present] = joined.split("\x00")
+    return result
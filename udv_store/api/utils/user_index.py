@@ -0,0 +1,221 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .versions import get_version, bump_version, is_stale
+
+VERSION_NAME = "user_index"
+
+# record of a user: (role, first_name, last_name, patronymic, last_name_key, first_name_key, patronymic_key)
+LAST_KEY, FIRST_KEY, PATRONYMIC_KEY = 4, 5, 6
+
+# search keys in the order of their rank, the same ranking as UserInfoQuerySet.search:
+# (record position, rank of an exact match, rank of a prefix match)
+FIELDS = ((LAST_KEY, 6, 4), (FIRST_KEY, 5, 3), (PATRONYMIC_KEY, 2, 1))
+BUCKETS = sorted(
+    [(exact, position, True) for position, exact, prefix in FIELDS] +
+    [(prefix, position, False) for position, exact, prefix in FIELDS],
+    reverse=True
+)
+PREFIX_END = "\uffff"
+
+
+def make_record(role, first_name, last_name, patronymic, first_name_key, last_name_key, patronymic_key) -> tuple:
+    return role, first_name, last_name, patronymic, last_name_key, first_name_key, patronymic_key
+
+
+class UserIndex:
+    """
+    Prefix index of the user directory. For every name key there is a sorted list of keys
+    and an array of user ids in the same order, lookups are binary searches over the list.
+    Entries with the same key are ordered by (last name, first name, id) like the search results.
+    """
+
+    def __init__(self, records: dict, version: int):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.records = records
+        self.keys = {}
+        self.ids = {}
+        for position, _, _ in FIELDS:
+            entries = sorted(
+                (record[position], record[LAST_KEY], record[FIRST_KEY], user_id) for user_id, record in records.items()
+            )
+            self.keys[position] = [entry[0] for entry in entries]
+            self.ids[position] = array("q", [entry[-1] for entry in entries])
+
+    @classmethod
+    def build(cls, version: int):
+        from ..models import UserInfo
+
+        # names repeat a lot, every distinct string is kept once
+        strings = {}
+        rows = UserInfo.objects.values_list(
+            "user_id", "role", "first_name", "last_name", "patronymic",
+            "first_name_key", "last_name_key", "patronymic_key"
+        ).iterator(chunk_size=5000)
+        return cls({row[0]: make_record(*(strings.setdefault(value, value) for value in row[1:])) for row in rows},
+                   version)
+
+    def order(self, user_id: int, position: int) -> tuple:
+        record = self.records[user_id]
+        return record[position], record[LAST_KEY], record[FIRST_KEY], user_id
+
+    def result_order(self, user_id: int) -> tuple:
+        record = self.records[user_id]
+        return record[LAST_KEY], record[FIRST_KEY], user_id
+
+    def bounds(self, position: int, key: str, exact: bool) -> tuple:
+        keys = self.keys[position]
+        if exact:
+            return bisect_left(keys, key), bisect_right(keys, key)
+        return bisect_right(keys, key), bisect_left(keys, key + PREFIX_END)
+
+    def matches(self, position: int, key: str):
+        start, end = bisect_left(self.keys[position], key), bisect_left(self.keys[position], key + PREFIX_END)
+        return self.ids[position][start:end]
+
+    def add(self, user_id: int, record: tuple):
+        self.remove(user_id)
+        self.records[user_id] = record
+        for position, _, _ in FIELDS:
+            keys, ids = self.keys[position], self.ids[position]
+            index, end = bisect_left(keys, record[position]), bisect_right(keys, record[position])
+            order = self.order(user_id, position)
+            while index < end and self.order(ids[index], position) < order:
+                index += 1
+            keys.insert(index, record[position])
+            ids.insert(index, user_id)
+
+    def remove(self, user_id: int):
+        record = self.records.pop(user_id, None)
+        if record is None:
+            return
+        for position, _, _ in FIELDS:
+            keys, ids = self.keys[position], self.ids[position]
+            index = bisect_left(keys, record[position])
+            while ids[index] != user_id:
+                index += 1
+            del keys[index]
+            del ids[index]
+
+    def search(self, keys: list, limit: int, exclude=None) -> list:
+        if len(keys) == 1:
+            user_ids = self.search_one(keys[0], limit, exclude)
+        else:
+            user_ids = self.search_many(keys, limit, exclude)
+
+        return [self.row(user_id) for user_id in user_ids]
+
+    def row(self, user_id: int) -> dict:
+        role, first_name, last_name, patronymic = self.records[user_id][:4]
+        return {"user_id": user_id, "role": role, "first_name": first_name, "last_name": last_name,
+                "patronymic": patronymic}
+
+    def search_one(self, key: str, limit: int, exclude=None) -> list:
+        # buckets are walked from the best rank down, a user gets the rank of the first bucket it is met in
+        seen = {exclude}
+        found = []
+        for _, position, exact in BUCKETS:
+            start, end = self.bounds(position, key, exact)
+            ids = self.ids[position]
+            if position == LAST_KEY:
+                # entries of the last name list are already in the order of the results
+                candidates = (ids[index] for index in range(start, end))
+            else:
+                candidates = heapq.nsmallest(limit - len(found) + len(seen), ids[start:end], key=self.result_order)
+
+            for user_id in candidates:
+                if user_id not in seen:
+                    seen.add(user_id)
+                    found.append(user_id)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def search_many(self, keys: list, limit: int, exclude=None) -> list:
+        # candidates are the users matching every word, the ranks of the words are summed up bucket by bucket
+        candidates = set.intersection(
+            *(set().union(*(self.matches(position, key) for position, _, _ in FIELDS)) for key in keys)
+        )
+        candidates.discard(exclude)
+
+        ranks = dict.fromkeys(candidates, 0)
+        for key in keys:
+            word_ranks = {}
+            # the best bucket of a user is applied last
+            for rank, position, exact in reversed(BUCKETS):
+                start, end = self.bounds(position, key, exact)
+                word_ranks.update(dict.fromkeys(candidates.intersection(self.ids[position][start:end]), rank))
+            for user_id, rank in word_ranks.items():
+                ranks[user_id] += rank
+
+        by_rank = {}
+        for user_id, rank in ranks.items():
+            by_rank.setdefault(rank, []).append(user_id)
+
+        found = []
+        for rank in sorted(by_rank, reverse=True):
+            found.extend(heapq.nsmallest(limit - len(found), by_rank[rank], key=self.result_order))
+            if len(found) == limit:
+                break
+        return found
+
+
+_index = None
+# _lock guards searches and in-place changes of the index, _build_lock lets one thread at a time rebuild it
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _is_current(index, version: int) -> bool:
+    return index is not None and index.version == version and not is_stale(index.built_at)
+
+
+def current_index(version: int) -> UserIndex:
+    # the index is built on the first search, and rebuilt after users were changed by another process.
+    # It is built outside of _lock, other threads keep searching the old index until the new one is swapped in
+    global _index
+    index = _index
+    if _is_current(index, version):
+        return index
+    if not _build_lock.acquire(blocking=index is None):
+        return index
+    try:
+        index = _index
+        if not _is_current(index, version):
+            index = UserIndex.build(version)
+            with _lock:
+                _index = index
+        return index
+    finally:
+        _build_lock.release()
+
+
+def search_users(keys: list, limit: int, exclude=None) -> list:
+    index = current_index(get_version(VERSION_NAME))
+    with _lock:
+        return index.search(keys, limit, exclude)
+
+
+def _apply(change):
+    # a change made here is applied in place, unless the index had already missed another change
+    version = bump_version(VERSION_NAME)
+    with _lock:
+        if _index is not None and _index.version == version - 1:
+            change(_index)
+            _index.version = version
+
+
+def user_saved(user_id: int, record: tuple):
+    _apply(lambda index: index.add(user_id, record))
+
+
+def user_deleted(user_id: int):
+    _apply(lambda index: index.remove(user_id))
+
+
+def invalidate_user_index():
+    bump_version(VERSION_NAME)
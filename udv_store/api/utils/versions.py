@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+
+# Version counters live in a shared cache, so every worker sees a bump made by any other one.
+# VERSIONS_CACHE_ALIAS should name a cache shared by all workers (redis, memcached, database).
+# With a per-process cache like LocMemCache, the Django default, a worker never sees the bumps
+# of the others, so data cached in a process is kept for LOCAL_CACHE_TTL seconds at most then.
+# When a counter is missing (first start or eviction) it restarts from the current time
+# and can never go back to a value some worker has already cached pages for.
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+DEFAULT_LOCAL_CACHE_TTL = 5
+
+
+def version_cache_alias() -> str:
+    return getattr(settings, "VERSIONS_CACHE_ALIAS", "default")
+
+
+def version_cache():
+    return caches[version_cache_alias()]
+
+
+def version_cache_backend() -> str:
+    return settings.CACHES.get(version_cache_alias(), {}).get("BACKEND", PROCESS_LOCAL_BACKENDS[0])
+
+
+def versions_shared() -> bool:
+    return version_cache_backend() not in PROCESS_LOCAL_BACKENDS
+
+
+def local_ttl():
+    # seconds data cached in a process is kept for, None keeps it until the version is bumped
+    return getattr(settings, "LOCAL_CACHE_TTL", None if versions_shared() else DEFAULT_LOCAL_CACHE_TTL)
+
+
+def is_stale(cached_at: float) -> bool:
+    # cached_at is a time.monotonic() value
+    ttl = local_ttl()
+    return ttl is not None and time.monotonic() - cached_at >= ttl
+
+
+def check_version_cache(app_configs, **kwargs):
+    if not versions_shared():
+        return [checks.Warning(
+            f"The versions cache \"{version_cache_alias()}\" uses {version_cache_backend()}, "
+            f"which is not shared between processes",
+            hint="Set VERSIONS_CACHE_ALIAS to a cache shared by all workers. Until then catalog pages, sizes "
+                 "and the user index are cached in each process for LOCAL_CACHE_TTL seconds only, and changes "
+                 "made by one worker reach the others after that time.",
+            id="api.W001",
+        )]
+    return []
+
+
+def get_version(name: str) -> int:
+    cache = version_cache()
+    key = "version:" + name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name: str) -> int:
+    cache = version_cache()
+    key = "version:" + name
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.incr(key)
@@ -1,19 +1,35 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 # from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F
+from django.views.decorators.http import condition
 # import io
 
-from .models import Activity, UcoinRequest, Present, BalanceHistory, UserInfo
+from .pagination import NewestFirstPagination
+from .models import Activity, UcoinRequest, Present, BalanceHistory, UserInfo, ImportJob, ImportedUser
 from django.contrib.auth.models import User
 from .serializer import UserInfoSerializer, MyTokenObtainPairSerializer, PublicUserInfoSerializer, \
     ActivityListSerializer, UcoinRequestSerializer, ProductsSerializer, PresentSerializer, \
     BalanceHistorySerializer, \
     ActivitySerializer, RequestListSerializer, RequestListFullDataSerializer, PresentListSerializer
+from .utils.ledger import post_entries, NotEnoughUcoins
+from .utils.notifications import get_broker, publish_present
+from .utils.user_index import search_users
+from .utils.staging import is_staging_name
+from .utils.conditional import requests_etag, activities_etag, activities_last_modified, presents_etag, \
+    balance_history_etag, balance_history_last_modified
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
@@ -29,6 +45,7 @@ def get_user_info(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=requests_etag)
 def get_request_latest(request):
     user = request.user
     return Response(RequestListSerializer(user.ucoinrequest_set.all()[:3], many=True).data)
@@ -36,12 +53,15 @@ def get_request_latest(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=requests_etag)
 def get_requests_full(request):
-    user = request.user
-    return Response(RequestListSerializer(user.ucoinrequest_set.all(), many=True).data)
+    paginator = NewestFirstPagination()
+    page = paginator.paginate_queryset(request.user.ucoinrequest_set.select_related("activity_id"), request)
+    return paginator.get_paginated_response(RequestListSerializer(page, many=True).data)
 
 
 @api_view(["GET"])
+@condition(etag_func=activities_etag, last_modified_func=activities_last_modified)
 def get_activities(request):
     return Response(ActivityListSerializer(Activity.objects.all(), many=True).data)
 
@@ -95,65 +115,112 @@ class BalanceAPIView(APIView):
 
 @api_view(["GET"])
 def get_requests_in_progress(request):
-    return Response(RequestListFullDataSerializer(UcoinRequest.objects.filter(state="IR"), many=True).data)
+    paginator = NewestFirstPagination()
+    page = paginator.paginate_queryset(
+        UcoinRequest.objects.filter(state="IR").select_related("user_id__userinfo", "activity_id"), request
+    )
+    return paginator.get_paginated_response(RequestListFullDataSerializer(page, many=True).data)
 
 
 @api_view(["POST", "DELETE"])
 def process_request(request, pk):
-    u_request = UcoinRequest.objects.get(request_id=pk)
+    u_request = UcoinRequest.objects.select_related("activity_id").get(request_id=pk)
 
     if request.method == "POST":
         u_request.set_state_rejected(comment=request.data["rejected_comment"])
 
     if request.method == "DELETE":
-        ucoin_count = u_request.activity_id.ucoins_count
-        u_request.user_id.userinfo.change_balance(ucoin_count, "add")
-        u_request.set_state_accepted()
-
-        BalanceHistory.objects.create(
-            user_id=u_request.user_id,
-            action="AD",
-            category="RQ",
-            category_id=pk,
-            ucoin_count=ucoin_count
-        )
+        with transaction.atomic():
+            u_request.set_state_accepted()
+            # activities without ucoins change no balance
+            if u_request.activity_id.ucoins_count > 0:
+                post_entries([
+                    BalanceHistory(
+                        user_id=u_request.user_id,
+                        action="AD",
+                        category="RQ",
+                        category_id=pk,
+                        ucoin_count=u_request.activity_id.ucoins_count
+                    )
+                ])
 
     return Response({"message": "Successfully!"})
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def search_user(request, search_request):
-    split_request = search_request.title().split(' ')
-    request_length = len(split_request)
+@api_view(["POST"])
+def process_requests_batch(request):
+    # {"requests": [{"request_id": 1, "action": "accept"},
+    #               {"request_id": 2, "action": "reject", "rejected_comment": "..."}]}
+    error = Response(
+        {"error_message": "Каждая заявка должна содержать request_id и action (accept или reject)"},
+        status=400
+    )
+    if not isinstance(request.data.get("requests"), list):
+        return error
+
+    decisions = {}
+    for decision in request.data["requests"]:
+        if not isinstance(decision, dict) or decision.get("action") not in ("accept", "reject"):
+            return error
+        try:
+            decisions[int(decision["request_id"])] = decision
+        except (KeyError, TypeError, ValueError):
+            return error
+
+    with transaction.atomic():
+        u_requests = list(
+            UcoinRequest.objects.select_for_update(of=("self",)).select_related("activity_id")
+            .filter(request_id__in=decisions.keys(), state="IR")
+        )
 
-    if request_length == 1:
-        users = User.objects.filter(
-            Q(userinfo__first_name__startswith=search_request) |
-            Q(userinfo__last_name__startswith=search_request)
-        )[:3]
-        if users.exists():
-            return Response(
-                PublicUserInfoSerializer([user.userinfo for user in users if user != request.user], many=True).data
-            )
+        entries = []
+        for u_request in u_requests:
+            decision = decisions[u_request.request_id]
+
+            if decision["action"] == "accept":
+                u_request.state = "AC"
+                entries.append(BalanceHistory(
+                    user_id_id=u_request.user_id_id,
+                    action="AD",
+                    category="RQ",
+                    category_id=u_request.request_id,
+                    ucoin_count=u_request.activity_id.ucoins_count
+                ))
+            else:
+                u_request.state = "RJ"
+                u_request.rejected_comment = decision.get("rejected_comment", "")
+
+        UcoinRequest.objects.bulk_update(u_requests, ["state", "rejected_comment"], batch_size=1000)
+        post_entries([entry for entry in entries if entry.ucoin_count > 0])
+
+    processed = {u_request.request_id for u_request in u_requests}
+    return Response({
+        "accepted": len(entries),
+        "rejected": len(processed) - len(entries),
+        "skipped": [pk for pk in decisions if pk not in processed]
+    })
 
-    if request_length == 2:
-        split_request = [*(map(lambda x: x[:6], split_request))]
 
-        q1 = (Q(userinfo__first_name__startswith=split_request[0]) &
-              Q(userinfo__last_name__startswith=split_request[1]))
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_user(request, search_request):
+    words = search_request.split()
 
-        q2 = (Q(userinfo__first_name__startswith=split_request[1]) &
-              Q(userinfo__last_name__startswith=split_request[0]))
+    if len(words) > 3:
+        return Response({"message": "Too many params, the search request may consist only of the last name, "
+                                    "first name and patronymic!"})
 
-        users = User.objects.filter(q1 | q2)
-        if users.exists():
-            return Response(
-                PublicUserInfoSerializer([user.userinfo for user in users if user != request.user], many=True).data
-            )
+    limit = getattr(settings, "SEARCH_USER_LIMIT", 10)
+    if getattr(settings, "SEARCH_USER_INDEX", True):
+        keys = [key for key in map(UserInfo.search_key, words) if key]
+        users = search_users(keys, limit, exclude=request.user.id) if keys else []
+    else:
+        users = PublicUserInfoSerializer(
+            UserInfo.objects.search(words).exclude(user_id=request.user.id)[:limit], many=True
+        ).data
 
-    if request_length > 2:
-        return Response({"message": "Too many params, the username consist only of the first name and last name!"})
+    if users:
+        return Response(users)
 
     return Response({"message": "Nothing found"})
 
@@ -161,11 +228,44 @@ def search_user(request, search_request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_unread_present_count(request):
-    return Response({"unread_present_count": request.user.present_set.filter(state="SN").count()})
+    return Response({"unread_present_count": request.user.userinfo.unread_present_count})
+
+
+# Long-poll for new presents: answers at once if the unread count differs from ?known=,
+# otherwise holds the connection until a present arrives or the timeout expires.
+# Async view, so under ASGI a waiting client doesn't occupy a worker thread.
+async def wait_unread_present_count(request):
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+    if auth is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    user = auth[0]
+    get_count = sync_to_async(
+        lambda: UserInfo.objects.filter(user_id=user.id).values_list("unread_present_count", flat=True).first()
+    )
+
+    broker = get_broker()
+    waiter = broker.subscribe(user.id)
+    try:
+        count = await get_count()
+        if request.GET.get("known") in (None, str(count)):
+            try:
+                await asyncio.wait_for(waiter, timeout=getattr(settings, "PRESENT_NOTIFICATIONS_TIMEOUT", 25))
+                count = await get_count()
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        broker.unsubscribe(user.id, waiter)
+
+    return JsonResponse({"unread_present_count": count})
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=presents_etag)
 def get_unread_present_list(request):
     return Response(
         PresentListSerializer(
@@ -177,13 +277,11 @@ def get_unread_present_list(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=presents_etag)
 def get_present_list(request):
-    return Response(
-        PresentListSerializer(
-            request.user.present_set.all(),
-            many=True)
-        .data
-    )
+    paginator = NewestFirstPagination()
+    page = paginator.paginate_queryset(request.user.present_set.all(), request)
+    return paginator.get_paginated_response(PresentListSerializer(page, many=True).data)
 
 
 @api_view(["GET", "POST"])
@@ -204,30 +302,33 @@ def manage_present_by_pk(request, pk):
 def create_present(request):
     request.data["user_from"] = request.user.id
 
-    count = request.data.get("ucoin_count")
-    if count is not None:
-        request.user.userinfo.change_balance(int(count), "remove")
-
     serializer = PresentSerializer(data=request.data)
 
     if serializer.is_valid():
-        serializer.save()
-        # return Response(serializer.data["id"])
-        BalanceHistory.objects.create(
-            user_id=User.objects.get(id=request.data["user_from"]),
-            action="EX",
-            category="PR",
-            category_id=serializer.data["id"],
-            ucoin_count=serializer.data["ucoin_count"]
-        )
-
-        BalanceHistory.objects.create(
-            user_id=User.objects.get(id=request.data["user_to"]),
-            action="AD",
-            category="PR",
-            category_id=serializer.data["id"],
-            ucoin_count=serializer.data["ucoin_count"]
-        )
+        try:
+            with transaction.atomic():
+                present = serializer.save()
+                post_entries([
+                    BalanceHistory(
+                        user_id=request.user,
+                        action="EX",
+                        category="PR",
+                        category_id=present.id,
+                        ucoin_count=present.ucoin_count
+                    ),
+                    BalanceHistory(
+                        user_id=present.user_to,
+                        action="AD",
+                        category="PR",
+                        category_id=present.id,
+                        ucoin_count=present.ucoin_count
+                    )
+                ])
+                UserInfo.objects.filter(user_id=present.user_to_id)\
+                    .update(unread_present_count=F("unread_present_count") + 1)
+                transaction.on_commit(lambda: publish_present(present))
+        except NotEnoughUcoins as e:
+            return Response({"error_message": str(e)}, status=400)
 
         return Response(status=200)
 
@@ -236,9 +337,11 @@ def create_present(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=balance_history_etag, last_modified_func=balance_history_last_modified)
 def get_balance_history(request):
-    return Response((BalanceHistorySerializer(
-        request.user.balancehistory_set.all(), many=True)).data)
+    paginator = NewestFirstPagination()
+    page = paginator.paginate_queryset(request.user.balancehistory_set.all(), request)
+    return paginator.get_paginated_response(BalanceHistorySerializer(page, many=True).data)
 
 
 @api_view(["POST"])
@@ -251,9 +354,9 @@ def create_user(request):
     user_patronymic = data["patronymic"]
 
     if len(username) == 0:
-        from .utils.table_parser import generate_username
+        from .utils.table_parser import generate_usernames
 
-        username = generate_username([user_first_name.lower(), user_last_name[0], user_patronymic[0]])
+        username = generate_usernames(['_'.join([user_first_name.lower(), user_last_name[0], user_patronymic[0]])])[0]
 
     new_user = User.objects.create_user(username=username, password="tempPas_" + username)
 
@@ -299,12 +402,45 @@ def manage_moderator(request, pk):
 @api_view(["POST"])
 # @permission_classes([IsAuthenticated])
 def create_users_by_table(request):
-    from .utils.register_user import register_users
+    if not is_staging_name(request.data.get("table_name")):
+        return Response({"error_message": "Неверное имя временной таблицы"}, status=400)
 
-    response = register_users(request.data["delete_users"], request.data["table_name"])
-    if type(response) == str:
-        return Response(status=200)
-    return Response({"error_message": "Some error!"})
+    job = ImportJob.objects.create(
+        kind=ImportJob.KindChoice.register_users,
+        params={"delete_users": request.data["delete_users"], "table_name": request.data["table_name"]}
+    )
+    return Response({"job_id": job.id})
+
+
+@api_view(["GET"])
+# @permission_classes([IsAuthenticated])
+def get_import_job(request, pk):
+    return Response(ImportJob.objects.get(id=pk).get_status())
+
+
+@api_view(["GET"])
+# @permission_classes([IsAuthenticated])
+def export_imported_users(request):
+    from tempfile import SpooledTemporaryFile
+    from django.http import FileResponse
+    from openpyxl import Workbook
+
+    # write-only workbook keeps a single row in memory, the file is spooled to disk when it grows
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["last_name", "first_name", "patronymic", "balance", "generated_username", "date"])
+
+    rows = ImportedUser.objects.values_list(
+        "last_name", "first_name", "patronymic", "balance", "username", "created_date"
+    ).iterator(chunk_size=2000)
+    for last_name, first_name, patronymic, balance, username, created_date in rows:
+        sheet.append([last_name, first_name, patronymic, balance, username, str(created_date.date())])
+
+    file = SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+    workbook.save(file)
+    file.seek(0)
+
+    return FileResponse(file, as_attachment=True, filename="Пользователи из загруженных таблиц.xlsx")
 
 
 class TableUploadAPI(APIView):
@@ -312,17 +448,28 @@ class TableUploadAPI(APIView):
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request, format=None):
-        from .utils.table_parser import parse_data_from_file
+        import os
+        from uuid import uuid4
         from json import loads
 
         name = request.data["table_name"]
-        table_format = name.rsplit(".")[-1]
-
-        response = parse_data_from_file(
-            request.data["table"], loads(request.data["table_settings"]), table_format == "csv"
+        table_format = name.rsplit(".")[-1].lower()
+        if table_format not in ("csv", "xlsx"):
+            return Response({"error_message": "Загруженный файл имеет неправильный формат"})
+
+        # the file is parsed by the import worker, so it is kept on disk until then
+        os.makedirs("media/tables/uploads", exist_ok=True)
+        file_path = f"media/tables/uploads/{uuid4().hex}.{table_format}"
+        with open(file_path, "wb") as file:
+            for chunk in request.data["table"].chunks():
+                file.write(chunk)
+
+        job = ImportJob.objects.create(
+            kind=ImportJob.KindChoice.parse_table,
+            params={
+                "file_path": file_path,
+                "table_settings": loads(request.data["table_settings"]),
+                "table_format": table_format
+            }
         )
-
-        if type(response) == str:
-            return Response({"error_message": response})
-        return Response(response)
-        # return Response('here!')
+        return Response({"job_id": job.id})